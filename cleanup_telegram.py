@@ -49,18 +49,24 @@ if __name__ == "__main__":
     # Мапа id -> chat_id для точного видалення
     id_to_chat = {}
     
-    if os.path.exists(state_file):
+    if os.path.exists(state_file) or os.path.exists(state_file + '.zst'):
         try:
-            with open(state_file, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-                # Перевіряємо різні типи повідомлень у state
-                for msg_type in ['_no_changes', '_last_alert']:
-                    msgs = state.get('last_messages', {}).get(msg_type, {})
-                    for rec_key, mid in msgs.items():
-                        # rec_key зазвичай містить chat_id як префікс (e.g. "-100..._83042")
-                        # або це просто chat_id
-                        cid = rec_key.split('_')[0]
-                        id_to_chat[int(mid)] = cid
+            if os.path.exists(state_file + '.zst'):
+                # Великий state зберігається стиснутим (zstandard)
+                import zstandard
+                with open(state_file + '.zst', 'rb') as f:
+                    state = json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+            else:
+                with open(state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            # Перевіряємо різні типи повідомлень у state
+            for msg_type in ['_no_changes', '_last_alert']:
+                msgs = state.get('last_messages', {}).get(msg_type, {})
+                for rec_key, mid in msgs.items():
+                    # rec_key зазвичай містить chat_id як префікс (e.g. "-100..._83042")
+                    # або це просто chat_id
+                    cid = rec_key.split('_')[0]
+                    id_to_chat[int(mid)] = cid
         except Exception as e:
             print(f"⚠️ Попередження: не вдалося повністю розпарсити state.json: {e}")
 
@@ -2,6 +2,7 @@ import sqlite3
 import logging
 from datetime import datetime
 from typing import List, Dict, Optional
+from utils import graph_id
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,8 @@ class HistoryDB:
         self.conn = sqlite3.connect(self.db_path)
         # Увімкнення підтримки зовнішніх ключів
         self.conn.execute("PRAGMA foreign_keys = ON")
+        # WAL: читання історії (візуалізатор) не блокує запис монітора і навпаки
+        self.conn.execute("PRAGMA journal_mode = WAL")
         self._init_db()
 
     def _init_db(self):
@@ -24,9 +27,11 @@ class HistoryDB:
                 product_key TEXT UNIQUE NOT NULL,
                 url TEXT NOT NULL,
                 name TEXT NOT NULL,
-                capacity_ah INTEGER
+                capacity_ah INTEGER,
+                graph_id TEXT
             )
         ''')
+        self._migrate_graph_id(cursor)
         
         # Таблиця історії залишків
         cursor.execute('''
@@ -51,6 +56,22 @@ class HistoryDB:
                 FOREIGN KEY (product_id) REFERENCES products (id)
             )
         ''')
+
+        # Кеш графіків: останні записи історії, з якими графік товару вже вивантажено
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS graph_cache (
+                product_id INTEGER PRIMARY KEY,
+                last_price_ts DATETIME,
+                last_stock_ts DATETIME,
+                rendered_on TEXT NOT NULL,
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            )
+        ''')
+
+        # Покривні індекси: історія товару читається впорядкованою за часом без сортування
+        # і без звернень до рядків таблиці (extract_data, MAX(timestamp) по товарах)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_pid_ts ON price_history (product_id, timestamp, price)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_pid_ts ON stock_history (product_id, timestamp, in_stock_qty, preorder_qty, status)')
         self.conn.commit()
         logger.info(f"База даних {self.db_path} ініціалізована та готова до роботи.")
 
@@ -59,40 +80,47 @@ class HistoryDB:
         """Уніфікована генерація ключа продукту"""
         return f"{product['link']}_{product.get('capacity', 0)}"
 
+    def _migrate_graph_id(self, cursor):
+        """Додає колонку graph_id у старі БД і заповнює її для товарів без неї"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(products)")}
+        if 'graph_id' not in columns:
+            cursor.execute("ALTER TABLE products ADD COLUMN graph_id TEXT")
+        missing = cursor.execute("SELECT id, product_key FROM products WHERE graph_id IS NULL").fetchall()
+        if missing:
+            cursor.executemany("UPDATE products SET graph_id = ? WHERE id = ?",
+                               [(graph_id(key), p_id) for p_id, key in missing])
+            logger.info(f"graph_id заповнено для {len(missing)} товарів.")
+
     def close(self):
         """Закриття з'єднання з БД"""
         if self.conn:
             self.conn.close()
             logger.info("З'єднання з базою даних закрите.")
 
-    def sync_products(self, current_products: List[Dict]):
-        """Синхронізація списку товарів з таблицею products"""
+    def sync_products(self, current_products: List[Dict]) -> Dict[str, int]:
+        """Синхронізація списку товарів з таблицею products.
+        Один UPSERT ... RETURNING id на товар замість SELECT + INSERT/UPDATE.
+        Повертає мапу product_key -> id.
+        """
         cursor = self.conn.cursor()
+        key_to_id = {}
         for product in current_products:
             product_key = self.generate_key(product)
             url = product['link']
             name = product['name']
             capacity_ah = product.get('capacity', 0)
-            
-            # Перевіряємо, чи існує вже такий продукт
-            cursor.execute('SELECT id, url, name, capacity_ah FROM products WHERE product_key = ?', (product_key,))
-            row = cursor.fetchone()
-            
-            if row:
-                # Оновлюємо тільки якщо є реальні зміни
-                if row[1] != url or row[2] != name or row[3] != capacity_ah:
-                    cursor.execute('''
-                        UPDATE products 
-                        SET url = ?, name = ?, capacity_ah = ?
-                        WHERE product_key = ?
-                    ''', (url, name, capacity_ah, product_key))
-            else:
-                # Вставляємо новий
-                cursor.execute('''
-                    INSERT INTO products (product_key, url, name, capacity_ah)
-                    VALUES (?, ?, ?, ?)
-                ''', (product_key, url, name, capacity_ah))
+
+            # graph_id залежить лише від product_key: записується при вставці, при оновленні не змінюється
+            cursor.execute('''
+                INSERT INTO products (product_key, url, name, capacity_ah, graph_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(product_key) DO UPDATE
+                SET url = excluded.url, name = excluded.name, capacity_ah = excluded.capacity_ah
+                RETURNING id
+            ''', (product_key, url, name, capacity_ah, graph_id(product_key)))
+            key_to_id[product_key] = cursor.fetchone()[0]
         self.conn.commit()
+        return key_to_id
 
     def get_product_id(self, product_key: str) -> Optional[int]:
         """Отримання внутрішнього id за ключем продукту"""
@@ -101,20 +129,22 @@ class HistoryDB:
         row = cursor.fetchone()
         return row[0] if row else None
 
-    def record_changes_bulk(self, products: List[Dict], timestamp: str = None):
+    def record_changes_bulk(self, products: List[Dict], timestamp: str = None, key_to_id: Dict[str, int] = None):
         """Масовий запис змін залишків та цін.
         Отримує всі останні стани одним запитом і порівнює в пам'яті.
+        key_to_id (результат sync_products) дозволяє пропустити пошук id.
         """
         if not products:
             return
 
         cursor = self.conn.cursor()
         
-        # 1. Отримуємо id для всіх переданих ключів
-        keys = [self.generate_key(p) for p in products]
-        placeholders = ','.join('?' * len(keys))
-        cursor.execute(f'SELECT product_key, id FROM products WHERE product_key IN ({placeholders})', keys)
-        key_to_id = {row[0]: row[1] for row in cursor.fetchall()}
+        # 1. Отримуємо id для всіх переданих ключів (якщо не передані готові)
+        if key_to_id is None:
+            keys = [self.generate_key(p) for p in products]
+            placeholders = ','.join('?' * len(keys))
+            cursor.execute(f'SELECT product_key, id FROM products WHERE product_key IN ({placeholders})', keys)
+            key_to_id = {row[0]: row[1] for row in cursor.fetchall()}
 
         # Збираємо всі ідентифікатори товарів
         product_ids = list(key_to_id.values())
@@ -194,3 +224,28 @@ class HistoryDB:
         if new_stocks or new_prices:
             self.conn.commit()
             logger.info(f"Оновлено історію: {len(new_stocks)} залишків, {len(new_prices)} цін.")
+
+    def get_history_signatures(self) -> Dict[int, tuple]:
+        """Час останнього запису цін та залишків для кожного товару з історією:
+        {product_id: (last_price_ts, last_stock_ts)}"""
+        signatures = {}
+        for p_id, ts in self.conn.execute('SELECT product_id, MAX(timestamp) FROM price_history GROUP BY product_id'):
+            signatures[p_id] = (ts, None)
+        for p_id, ts in self.conn.execute('SELECT product_id, MAX(timestamp) FROM stock_history GROUP BY product_id'):
+            signatures[p_id] = (signatures.get(p_id, (None, None))[0], ts)
+        return signatures
+
+    def get_graph_cache(self) -> Dict[int, tuple]:
+        """Кеш графіків: {product_id: (last_price_ts, last_stock_ts, rendered_on)}"""
+        return {row[0]: tuple(row[1:]) for row in self.conn.execute(
+            'SELECT product_id, last_price_ts, last_stock_ts, rendered_on FROM graph_cache')}
+
+    def update_graph_cache(self, entries: Dict[int, tuple]):
+        """Запис кешу графіків після успішного вивантаження"""
+        if not entries:
+            return
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO graph_cache (product_id, last_price_ts, last_stock_ts, rendered_on)
+            VALUES (?, ?, ?, ?)
+        ''', [(p_id, *entry) for p_id, entry in entries.items()])
+        self.conn.commit()
@@ -15,20 +15,16 @@ import random
 import requests
 import argparse
 import shutil
-import copy
 from logging.handlers import RotatingFileHandler
 from typing import List, Dict, Optional, Set
 from datetime import datetime
+from html import unescape
 from bs4 import BeautifulSoup
 
 import settings
 from db_manager import HistoryDB
-from utils import clean_price, extract_capacity, shorten_name, mask_sensitive, extract_grade
-from telegram_notifier import TelegramNotifier
-try:
-    from visualize_history import HistoryVisualizer
-except ImportError:
-    HistoryVisualizer = None
+from utils import clean_price, extract_capacity, shorten_name, mask_sensitive, extract_grade, parse_delivery_date
+from telegram_notifier import TelegramNotifier, _auto_cooldown_hours
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -49,6 +45,66 @@ except Exception as e:
     print(f"CRITICAL ERROR during undetected-chromedriver import: {e}")
     sys.exit(1)
 
+# Опціонально: стиснення великого state.json (pip install zstandard)
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+STATE_COMPRESS_THRESHOLD = 1024 * 1024  # 1MB
+
+# Статуси товарів, що відстежуються (In Stock та Pre-order)
+_ACTIVE_STATUSES = frozenset(('in_stock', 'preorder'))
+
+def _intern_statuses(products: Dict) -> Dict:
+    """Інтернує stock_status товарів, завантажених зі state.json.
+    Літерали в коді вже інтерновані, тож порівняння статусів спрацьовує за ідентичністю."""
+    for item in products.values():
+        status = item.get('stock_status') if isinstance(item, dict) else None
+        if isinstance(status, str):
+            item['stock_status'] = sys.intern(status)
+    return products
+
+# Посилання <a href> всередині <li class="... pages-item-next ..."> (пагінація Magento 2)
+_NEXT_PAGE_RE = re.compile(
+    r'<li\b[^>]*\bclass\s*=\s*"(?:[^"]*\s)?pages-item-next(?:\s[^"]*)?"[^>]*>'
+    r'(?:(?!</li>).)*?<a\b[^>]*?\shref\s*=\s*"([^"]*)"',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Шаблони розбору відповіді кошика (компілюються один раз)
+_QTY_ERROR_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'only\s+([0-9]+)\s+left',
+    r'most\s+you\s+can\s+purchase\s+is\s+([0-9]+)',
+    r'максимальна\s+кількість\s+.*?\s+([0-9]+)',
+    r'залишилося\s+лише\s+([0-9]+)'
+))
+# Специфічні фрази для нульового залишку (тільки явна відсутність)
+_ZERO_STOCK_RES = (re.compile(r'out of stock', re.IGNORECASE),)
+# Відомі фрази "недоступної кількості"
+_UNAVAILABLE_RES = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'запитаної кількості немає в наявності',
+    r'requested qty is not available',
+    r'requested quantity is not available'
+))
+# Опції "без шин" у селекторах товару
+_NEGATIVE_OPTION_RES = tuple(re.compile(p) for p in (r'\bні\b', r'\bбез\b', r'\bno\b', r'\bnone\b', r'не потрібні'))
+
+def _apply_stock_delta(decrease: int, increase: int, delta: int, restock_threshold: int) -> tuple:
+    """
+    Числове ядро лічильників залишку, повертає нові (decrease, increase).
+    Продаж (delta < 0) зменшує decrease; повернення (0 < delta <= порогу) компенсує
+    продажі, але decrease не стає додатним; більша дельта — поповнення складу.
+    """
+    if delta < 0:
+        return decrease + delta, increase
+    if delta <= restock_threshold:
+        return min(decrease + delta, 0), increase
+    return decrease, increase + delta
+
+# Джерело поточного часу монітора (тести підміняють його замість patch datetime)
+_now = datetime.now
+
 # Налаштування логування
 handler = RotatingFileHandler(
     'nkon_monitor.log',
@@ -84,7 +140,8 @@ class NkonMonitor:
             'detail_fetch_delay': settings.DETAIL_FETCH_DELAY,
             'heartbeat_times': settings.HEARTBEAT_TIMES,
             'quiet_hours_start': settings.QUIET_HOURS_START,
-            'quiet_hours_end': settings.QUIET_HOURS_END
+            'quiet_hours_end': settings.QUIET_HOURS_END,
+            'parse_mode': settings.TELEGRAM_PARSE_MODE
         }
         
         self.state_file = 'state.json'
@@ -93,13 +150,14 @@ class NkonMonitor:
         self.last_messages = {}
         self.stock_cumulative_diffs = {}
         self.last_notification_time = datetime.min
+        self._zstd_cctx = zstd.ZstdCompressor(level=3) if zstd else None # Для великого state.json
         
         # Завантаження стану
         loaded_state = self._load_state()
         
         # Обробка версій State
         if (loaded_state.get('version') or 0) >= 2:
-            self.previous_state = loaded_state.get('products', {})
+            self.previous_state = _intern_statuses(loaded_state.get('products', {}))
             self.quietly_removed = loaded_state.get('quietly_removed', {})
             self.last_messages = loaded_state.get('last_messages', {})
             self.stock_cumulative_diffs = loaded_state.get('stock_cumulative_diffs', {})
@@ -107,7 +165,7 @@ class NkonMonitor:
             self.last_notification_time = datetime.fromisoformat(nt_str) if nt_str else datetime.min
         else:
             # Legacy state
-            self.previous_state = loaded_state
+            self.previous_state = _intern_statuses(loaded_state)
             self.quietly_removed = {}
             
         self.session = requests.Session()
@@ -134,8 +192,8 @@ class NkonMonitor:
             logger.info("Запис інформації до бази даних історії...")
             db = HistoryDB()
             try:
-                db.sync_products(products)
-                db.record_changes_bulk(products)
+                key_to_id = db.sync_products(products)
+                db.record_changes_bulk(products, key_to_id=key_to_id)
                 logger.info("✅ Історія успішно збережена в БД.")
             finally:
                 db.close()
@@ -144,6 +202,18 @@ class NkonMonitor:
 
     def _load_state(self) -> Dict:
         """Завантаження попереднього стану (для відстеження змін)"""
+        zst_file = self.state_file + '.zst'
+        if os.path.exists(zst_file):
+            if zstd is None:
+                # Без стану всі товари були б оголошені новими
+                logger.error(f"❌ State збережено у {zst_file}, але пакет zstandard недоступний (pip install zstandard)")
+                logger.critical("🚫 Не вдалося завантажити state. Вихід...")
+                sys.exit(1)
+            try:
+                with open(zst_file, 'rb') as f:
+                    return json.loads(zstd.ZstdDecompressor().decompress(f.read()))
+            except Exception as e:
+                logger.warning(f"Не вдалося завантажити стиснений state: {e}")
         if os.path.exists(self.state_file):
             try:
                 with open(self.state_file, 'r', encoding='utf-8') as f:
@@ -153,31 +223,55 @@ class NkonMonitor:
         return {}
     
     def _save_state(self, items: Dict):
-        """Збереження поточного стану з бекапом попереднього"""
+        """Збереження поточного стану з бекапом попереднього.
+        Якщо state більший за STATE_COMPRESS_THRESHOLD і доступний zstandard,
+        він зберігається стиснутим у state.json.zst.
+        """
         try:
-            # Ротація: зберігаємо попередній файл як .previous.json
-            if os.path.exists(self.state_file):
-                backup_file = self.state_file.replace('.json', '.previous.json')
-                shutil.copy2(self.state_file, backup_file)
-                # logger.debug(f"Створено бекап стейту: {backup_file}")
-                
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(items, f, ensure_ascii=False, indent=2)
+            zst_file = self.state_file + '.zst'
+            data = json.dumps(items, ensure_ascii=False, indent=2).encode('utf-8')
+            compress = self._zstd_cctx is not None and len(data) > STATE_COMPRESS_THRESHOLD
+            if compress:
+                data = self._zstd_cctx.compress(data)
+            target, stale = (zst_file, self.state_file) if compress else (self.state_file, zst_file)
+
+            # Ротація: зберігаємо попередній файл як .previous.json(.zst)
+            for path in (self.state_file, zst_file):
+                if os.path.exists(path):
+                    backup_file = path.replace('.json', '.previous.json')
+                    shutil.copy2(path, backup_file)
+                    # logger.debug(f"Створено бекап стейту: {backup_file}")
+            
+            # Атомарний запис через тимчасовий файл
+            tmp_file = target + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, target)
+            # Прибираємо файл іншого формату, щоб не завантажити застарілий стан
+            if os.path.exists(stale):
+                os.remove(stale)
             
             # Логуємо кількість товарів, якщо це State v2 об'єкт
             product_count = len(items.get('products', {})) if isinstance(items, dict) and 'products' in items else len(items)
-            logger.info(f"💾 State збережено до {self.state_file}: {product_count} товарів")
+            logger.info(f"💾 State збережено до {target}: {product_count} товарів")
         except Exception as e:
             logger.error(f"Помилка збереження state: {e}")
 
-    def _update_stock_counters(self, current_products: List[Dict], msg_key: str):
+    def _calculate_auto_cooldown(self, heartbeat_times) -> float:
+        """Кулдаун Heartbeat за розкладом (кешується за кортежем часів)"""
+        return _auto_cooldown_hours(tuple(heartbeat_times))
+
+    def _update_stock_counters(self, current_products: List[Dict], msg_key: str) -> Dict[str, Dict]:
         """
         Оновлює лічильники змін залишків для конкретного отримувача.
+        Повертає змінені записи {ключ товару: diffs} (ті самі об'єкти, що й у stock_cumulative_diffs).
         """
         restock_threshold = self.config.get('restock_threshold', 100)
         
-        # Отримуємо дельти конкретно для цього отримувача
-        rec_all_diffs = self.stock_cumulative_diffs.get(msg_key, {})
+        # Отримуємо дельти конкретно для цього отримувача (оновлюються на місці)
+        rec_all_diffs = self.stock_cumulative_diffs.setdefault(msg_key, {})
+        previous_state = self.previous_state
+        touched = {}
         
         # Визначаємо, чи потрібно логувати (тільки для першого отримувача в списку)
         # Це допомагає уникнути дублювання логів, якщо отримувачів багато
@@ -197,35 +291,35 @@ class NkonMonitor:
             key = f"{item['link']}_{item.get('capacity', '0')}"
             
             # Обчислення дельти відносно ПОПЕРЕДНЬОГО запуску
-            prev_stock = self.previous_state.get(key, {}).get('real_stock')
+            prev = previous_state.get(key)
+            prev_stock = prev.get('real_stock') if prev else None
             
             if prev_stock is None or prev_stock == current_stock:
                 continue
                 
             delta = current_stock - prev_stock
-            diffs = rec_all_diffs.get(key, {"decrease": 0, "increase": 0})
+            diffs = rec_all_diffs.get(key)
+            if diffs is None:
+                diffs = rec_all_diffs[key] = {"decrease": 0, "increase": 0}
+            touched[key] = diffs
             
-            short = shorten_name(item.get('name', key))
-            if delta < 0:
-                diffs["decrease"] += delta
-                if should_log: logger.info(f"📉 {short}: {delta} (продаж)")
-            elif delta <= restock_threshold:
-                diffs["decrease"] += delta
-                before_clamp = diffs["decrease"]
-                diffs["decrease"] = min(diffs["decrease"], 0)
-                
-                if should_log:
-                    if diffs["decrease"] != before_clamp:
+            old_decrease = diffs["decrease"]
+            diffs["decrease"], diffs["increase"] = _apply_stock_delta(
+                old_decrease, diffs["increase"], delta, restock_threshold)
+            
+            if should_log:
+                short = shorten_name(item.get('name', key))
+                if delta < 0:
+                    logger.info(f"📉 {short}: {delta} (продаж)")
+                elif delta <= restock_threshold:
+                    if diffs["decrease"] != old_decrease + delta:
                         logger.info(f"🔄 {short}: +{delta} (повернення, decrease обрізано до 0)")
                     else:
                         logger.info(f"🔄 {short}: +{delta} (повернення, decrease: {diffs['decrease']})")
-            else:
-                diffs["increase"] += delta
-                if should_log: logger.info(f"🟢 {short}: +{delta} (поповнення складу)")
-                
-            rec_all_diffs[key] = diffs
-            
-        self.stock_cumulative_diffs[msg_key] = rec_all_diffs
+                else:
+                    logger.info(f"🟢 {short}: +{delta} (поповнення складу)")
+        
+        return touched
 
     def _create_proxy_auth_extension(self, proxy_host, proxy_port, proxy_user, proxy_pass, plugin_path):
         """Створення розширення для авторизації на проксі в Chrome"""
@@ -417,10 +511,8 @@ class NkonMonitor:
             soup = BeautifulSoup(driver.page_source, 'html.parser')
             date_elem = soup.select_one('.ampreorder-observed')
             if date_elem:
-                match = re.search(r'(\d{1,2})-(\d{1,2})-(\d{4})', date_elem.get_text())
-                if match:
-                    d, m, y = match.groups()
-                    extracted_date = f"{int(d):02d}-{int(m):02d}-{y}"
+                extracted_date = parse_delivery_date(date_elem.get_text())
+                if extracted_date:
                     logger.info(f"  └── Знайдено дату: {extracted_date}")
                     return extracted_date
             
@@ -488,22 +580,13 @@ class NkonMonitor:
             error_elems = soup.select(error_selector)
             if error_elems:
                 text = error_elems[-1].get_text(strip=True)
-                patterns = [
-                    r'only\s+(\d+)\s+left',
-                    r'most\s+you\s+can\s+purchase\s+is\s+(\d+)',
-                    r'максимальна\s+кількість\s+.*?\s+(\d+)',
-                    r'залишилося\s+лише\s+(\d+)'
-                ]
-                for pattern in patterns:
-                    match = re.search(pattern, text, re.IGNORECASE)
+                for pattern in _QTY_ERROR_RES:
+                    match = pattern.search(text)
                     if match:
                         return ('error', int(match.group(1)))
                 
                 # Специфічні фрази для нульового залишку (тільки явна відсутність)
-                zero_stock_patterns = [
-                    r'out of stock'
-                ]
-                if any(re.search(p, text, re.IGNORECASE) for p in zero_stock_patterns):
+                if any(p.search(text) for p in _ZERO_STOCK_RES):
                     # "The requested qty is not available"
                     # означає "ви запитали більше ніж є", а НЕ "товар відсутній"
                     if "requested qty" not in text.lower():
@@ -511,12 +594,7 @@ class NkonMonitor:
                 
                 # Помилка є, але кількість не розпізнана
                 # Перевіряємо на відомі фрази "недоступної кількості"
-                unavailable_patterns = [
-                    r'запитаної кількості немає в наявності',
-                    r'requested qty is not available',
-                    r'requested quantity is not available'
-                ]
-                if any(re.search(p, text, re.IGNORECASE) for p in unavailable_patterns):
+                if any(p.search(text) for p in _UNAVAILABLE_RES):
                     return ('silence', None)
 
                 # Також перевіряємо на "Обов’язкове поле"
@@ -567,12 +645,11 @@ class NkonMonitor:
                             s = Select(selector)
                             if not s.first_selected_option or s.first_selected_option.get_attribute('value') == "":
                                 priority_keywords = ['busbar', 'шини', 'шин', 'так', 'yes']
-                                negative_patterns = [r'\bні\b', r'\bбез\b', r'\bno\b', r'\bnone\b', r'не потрібні']
                                 target_idx = None
                                 for i in range(1, len(s.options)):
                                     opt_text = s.options[i].text.lower()
                                     if any(kw in opt_text for kw in priority_keywords):
-                                        if not any(re.search(pat, opt_text) for pat in negative_patterns):
+                                        if not any(pat.search(opt_text) for pat in _NEGATIVE_OPTION_RES):
                                             target_idx = i
                                             break
                                 if target_idx is None:
@@ -704,12 +781,10 @@ class NkonMonitor:
         """
         Знаходить URL наступної сторінки в пагінації Magento 2
         """
-        soup = BeautifulSoup(html, 'html.parser')
-        next_item = soup.find('li', class_='pages-item-next')
-        if next_item:
-            next_link = next_item.find('a')
-            if next_link and next_link.get('href'):
-                return next_link.get('href')
+        # Один regex-пошук замість побудови DOM усієї сторінки
+        match = _NEXT_PAGE_RE.search(html)
+        if match and match.group(1):
+            return unescape(match.group(1))
         return None
 
     def parse_products(self, html: str) -> List[Dict]:
@@ -798,7 +873,7 @@ class NkonMonitor:
             'stock_status': stock_status,  # 'in_stock' або 'preorder'
             'delivery_date': None,       # Буде заповнено пізніше в run() якщо preorder
             'real_stock': None,          # Реальний залишок
-            'timestamp': datetime.now().isoformat()
+            'timestamp': _now().isoformat()
         }
     
     def _check_stock_status(self, item) -> Optional[str]:
@@ -913,7 +988,7 @@ class NkonMonitor:
                 if status_changed or date_changed:
                     real_stock = product.get('real_stock')
                     # Якщо статус змінився на in_stock або preorder і кількість <= порогу, ігноруємо цю подію
-                    is_restock = status_changed and product['stock_status'] in ['in_stock', 'preorder']
+                    is_restock = status_changed and product['stock_status'] in _ACTIVE_STATUSES
                     
                     should_notify = True
                     if is_restock and real_stock is not None and real_stock <= settings.SMALL_RESTOCK_THRESHOLD:
@@ -1026,7 +1101,7 @@ class NkonMonitor:
                 
                 # Додатково: отримання деталей
                 if effective_fetch_dates or effective_fetch_stock:
-                    target_items = [p for p in products if p['stock_status'] in ['in_stock', 'preorder']]
+                    target_items = [p for p in products if p['stock_status'] in _ACTIVE_STATUSES]
                     
                     if target_items:
                         logger.info(f"Збір деталей для {len(target_items)} товарів (Dates={effective_fetch_dates}, Stock={effective_fetch_stock})...")
@@ -1046,7 +1121,7 @@ class NkonMonitor:
                                         p['delivery_date'] = old_p['delivery_date']
                             
                             # 2. Реальний залишок — адаптивний пошук для preorder та in_stock товарів.
-                            if effective_fetch_stock and p['stock_status'] in ('preorder', 'in_stock'):
+                            if effective_fetch_stock and p['stock_status'] in _ACTIVE_STATUSES:
                                 key = f"{p['link']}_{p.get('capacity', '0')}"
                                 old_p = self.previous_state.get(key)
                                 prev_stock = old_p.get('real_stock') if old_p else None
@@ -1063,6 +1138,7 @@ class NkonMonitor:
                                         p['real_stock'] = old_p['real_stock']
             else:
                 # Режим використання стану без парсингу
+                import copy
                 test_state_file = 'test_new_state.json'
                 if os.path.exists(test_state_file):
                     try:
@@ -1081,7 +1157,7 @@ class NkonMonitor:
                     products = []
             
             # Остаточна фільтрація: видаляємо виявлені out_of_stock
-            products = [p for p in products if p['stock_status'] in ['in_stock', 'preorder']]
+            products = [p for p in products if p['stock_status'] in _ACTIVE_STATUSES]
             
             if not products:
                 logger.warning("Не знайдено товарів після фільтрації")
@@ -1096,13 +1172,12 @@ class NkonMonitor:
 
             # Визначаємо URL головного каналу (з першого реципієнта)
             main_channel_url = settings.RECIPIENTS[0].get('url') if settings.RECIPIENTS else None
-            # Збір всіх посилань для футера (всі, крім першого - головного каналу)
-            all_footer_links = [
-                {'url': r['url'], 'name': r.get('name', 'Чат')}
-                for r in settings.RECIPIENTS[1:] if r.get('url')
-            ]
+            # Посилання для футера (всі, крім першого - головного каналу), зібрані в settings
+            all_footer_links = settings.FOOTER_LINKS
 
             logger.info(f"Початок розсилки для {len(settings.RECIPIENTS)} отримувачів...")
+            # Один час для всіх повідомлень розсилки
+            formatted_now = _now().strftime(TelegramNotifier.TIMESTAMP_FORMAT)
             
             for i, recipient in enumerate(settings.RECIPIENTS):
                 chat_id = str(recipient['chat_id'])
@@ -1128,7 +1203,7 @@ class NkonMonitor:
                 
                 # 1. Повні звіти
                 if rpt_type == 'full':
-                    msg_full = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=False, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                    msg_full = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=False, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                     if msg_full:
                         sent = self.telegram.send_telegram_message(msg_full, chat_ids={chat_id}, thread_id=thread_id, dry_run=dry_run)
                         if chat_id in sent:
@@ -1136,7 +1211,7 @@ class NkonMonitor:
                 
                 # 2. Звіти про зміни
                 elif rpt_type == 'changes':
-                    msg_ch = self.telegram.format_telegram_message(rec_changes, include_unchanged=False, is_update=False, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                    msg_ch = self.telegram.format_telegram_message(rec_changes, include_unchanged=False, is_update=False, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                     should_notify, reason = self.telegram._should_notify(recipient, bool(msg_ch), self.last_notification_time)
                     if force_notify:
                         should_notify, reason = True, "force-notify"
@@ -1147,7 +1222,7 @@ class NkonMonitor:
                     if msg_ch:
                         # Зафіксувати дельти у старому повідомленні
                         if last_nc_id and not dry_run:
-                            msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                            msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                             self.telegram.edit_telegram_message(chat_id, last_nc_id, msg_upd)
                         
                         # Скидаємо лічильники ТІЛЬКИ ПІСЛЯ оновлення старого (як контрольна точка)
@@ -1156,13 +1231,13 @@ class NkonMonitor:
                         # Нове повідомлення про зміни
                         logger.info(f"📣 Зміни для {msg_key}: надсилаємо звіт")
                         self.telegram.send_telegram_message(msg_ch, chat_ids={chat_id}, thread_id=thread_id, dry_run=dry_run)
-                        self.last_notification_time = datetime.now()
+                        self.last_notification_time = _now()
                         
                         if not dry_run: time.sleep(2)
                         
                         # Новий стан (тихо)
                         no_changes_only = {'new': [], 'removed': [], 'price_changes': [], 'status_changes': [], 'current': rec_changes['current']}
-                        msg_ns = self.telegram.format_telegram_message(no_changes_only, include_unchanged=True, is_update=False, show_stock_diffs=False, unchanged_header="Новий стан", msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                        msg_ns = self.telegram.format_telegram_message(no_changes_only, include_unchanged=True, is_update=False, show_stock_diffs=False, unchanged_header="Новий стан", msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                         sent_st = self.telegram.send_telegram_message(msg_ns, chat_ids={chat_id}, thread_id=thread_id, dry_run=dry_run, disable_notification=True)
                         if chat_id in sent_st:
                             active_no_changes[msg_key] = sent_st[chat_id]
@@ -1170,35 +1245,24 @@ class NkonMonitor:
                     elif reason == "heartbeat" or reason == "force-notify":
                         logger.info(f"🔔 Heartbeat/Force для {msg_key}")
                         if last_nc_id and not dry_run:
-                            msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                            msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                             self.telegram.edit_telegram_message(chat_id, last_nc_id, msg_upd)
                         
                         self.stock_cumulative_diffs[msg_key] = {}
                         if not dry_run: time.sleep(2)
                         
                         no_changes_only = {'new': [], 'removed': [], 'price_changes': [], 'status_changes': [], 'current': rec_changes['current']}
-                        msg_hb = self.telegram.format_telegram_message(no_changes_only, include_unchanged=True, is_update=False, show_stock_diffs=False, unchanged_header="Новий стан", msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                        msg_hb = self.telegram.format_telegram_message(no_changes_only, include_unchanged=True, is_update=False, show_stock_diffs=False, unchanged_header="Новий стан", msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                         sent_hb = self.telegram.send_telegram_message(msg_hb, chat_ids={chat_id}, thread_id=thread_id, dry_run=dry_run, disable_notification=False)
-                        self.last_notification_time = datetime.now()
+                        self.last_notification_time = _now()
                         if chat_id in sent_hb:
                             active_no_changes[msg_key] = sent_hb[chat_id]
                     
                     else:
                         # Без змін - тихо редагувати
-                        msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs)
+                        msg_upd = self.telegram.format_telegram_message(rec_changes, include_unchanged=True, is_update=True, show_stock_diffs=True, msg_key=msg_key, header_link=header_link, footer_links=footer_links, stock_cumulative_diffs=self.stock_cumulative_diffs, formatted_now=formatted_now)
                         if not msg_upd:
-                            if header_link:
-                                msg_upd = f"[🔋 NKON Monitor]({header_link})\n\n📋 Без змін\n\n🕒 {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
-                            else:
-                                msg_upd = f"🔋 *NKON Monitor*\n\n📋 Без змін\n\n🕒 {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
-                            
-                            if footer_links:
-                                links_list = [
-                                    f"[{link.get('name', 'Чат')}]({link['url']})"
-                                    for link in footer_links if link.get('url')
-                                ]
-                                if links_list:
-                                    msg_upd += f"\n\n💬 Обговорення: " + " | ".join(links_list)
+                            msg_upd = self.telegram.format_no_changes_message(formatted_now, header_link, footer_links)
                         
                         success = False
                         if last_nc_id and not dry_run:
@@ -1237,15 +1301,24 @@ class NkonMonitor:
                 self._save_history_to_db(products)
                 
                 # Генерація та завантаження графіків історії
-                if not no_graphs and settings.GENERATE_GRAPHS and HistoryVisualizer and settings.FTP_HOST and settings.VISUALIZATION_BASE_URL:
+                if not no_graphs and settings.GENERATE_GRAPHS and settings.FTP_HOST and settings.VISUALIZATION_BASE_URL:
                     try:
-                        logger.info("Генерація та вивантаження графіків історії...")
-                        visualizer = HistoryVisualizer()
-                        files = visualizer.generate_htmls()
-                        if files:
-                            visualizer.upload_to_sftp(files)
-                    except Exception as e:
-                        logger.error(f"Помилка при обробці графіків візуалізації: {e}")
+                        # Лінивий імпорт: візуалізатор потрібен лише при генерації графіків
+                        from visualize_history import HistoryVisualizer
+                    except ImportError:
+                        HistoryVisualizer = None
+                    if HistoryVisualizer:
+                        try:
+                            logger.info("Генерація та вивантаження графіків історії...")
+                            visualizer = HistoryVisualizer()
+                            try:
+                                # Лише графіки з новими записами історії (або ще не оновлені сьогодні),
+                                # вивантажуються прямо з пам'яті без тимчасових файлів
+                                visualizer.generate_and_upload(only_changed=True)
+                            finally:
+                                visualizer.close()
+                        except Exception as e:
+                            logger.error(f"Помилка при обробці графіків візуалізації: {e}")
             else:
                 logger.info("🚫 No-DB Run: Запис до БД пропущено")
             
@@ -1254,10 +1327,11 @@ class NkonMonitor:
             logger.info("=" * 60)
 
         except Exception as e:
-            error_msg = f"❌ *КРИТИЧНА ПОМИЛКА МОНІТОРИНГУ*\n\n"
-            error_msg += f"Тип: `{type(e).__name__}`\n"
-            error_msg += f"Помилка: `{str(e)}`\n"
-            error_msg += f"Час: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            tg = self.telegram
+            error_msg = "❌ " + tg.bold("КРИТИЧНА ПОМИЛКА МОНІТОРИНГУ") + "\n\n"
+            error_msg += f"Тип: {tg.code(type(e).__name__)}\n"
+            error_msg += f"Помилка: {tg.code(tg.escape(str(e)))}\n"
+            error_msg += f"Час: {_now().strftime('%Y-%m-%d %H:%M:%S')}"
             
             logger.error(f"Критична помилка: {e}", exc_info=True)
             
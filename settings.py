@@ -30,6 +30,16 @@ PROXY_PASS = os.getenv('PROXY_PASS', '')
 QUIET_HOURS_START = int(os.getenv('QUIET_HOURS_START', 21))
 QUIET_HOURS_END = int(os.getenv('QUIET_HOURS_END', 8))
 
+# --- Telegram formatting ---
+# Markdown (за замовчуванням) або HTML; значення без урахування регістру зводиться до назви, яку приймає API
+TELEGRAM_PARSE_MODES = {'markdown': 'Markdown', 'html': 'HTML'}
+_raw_parse_mode = os.getenv('TELEGRAM_PARSE_MODE', 'Markdown')
+TELEGRAM_PARSE_MODE = TELEGRAM_PARSE_MODES.get(_raw_parse_mode.strip().lower())
+if TELEGRAM_PARSE_MODE is None:
+    # Текст форматується лише під Markdown або HTML: інший parse_mode Telegram відхилить або спотворить
+    print(f"❌ Unsupported TELEGRAM_PARSE_MODE: {_raw_parse_mode!r} (expected Markdown or HTML), using Markdown")
+    TELEGRAM_PARSE_MODE = 'Markdown'
+
 # --- Visualization ---
 FTP_HOST = os.getenv('FTP_HOST', '')
 FTP_USER = os.getenv('FTP_USER', '')
@@ -37,6 +47,10 @@ FTP_PASS = os.getenv('FTP_PASS', '')
 FTP_DIR = os.getenv('FTP_DIR', '/')
 VISUALIZATION_BASE_URL = os.getenv('VISUALIZATION_BASE_URL', '')
 GENERATE_GRAPHS = os.getenv('GENERATE_GRAPHS', 'true').lower() == 'true'
+# Upload graphs pre-compressed as graph_<id>.html.gz (the web server must serve them with Content-Encoding: gzip)
+GRAPHS_GZIP = os.getenv('GRAPHS_GZIP', 'false').lower() == 'true'
+# Serve Chart.js from copies uploaded next to the graphs instead of the CDN
+GRAPHS_LOCAL_ASSETS = os.getenv('GRAPHS_LOCAL_ASSETS', 'false').lower() == 'true'
 TELEGRAPH_ACCESS_TOKEN = os.getenv('TELEGRAPH_ACCESS_TOKEN', '')
 
 # --- Statcounter Analytics ---
@@ -54,6 +68,12 @@ except json.JSONDecodeError:
     print(f"❌ Error parsing TELEGRAM_CONFIG_JSON: {raw_config}")
     RECIPIENTS = []
 
+# Footer links for the main channel: every recipient except the first one (built once)
+FOOTER_LINKS = tuple(
+    {'url': r['url'], 'name': r.get('name', 'Чат')}
+    for r in RECIPIENTS[1:] if r.get('url')
+)
+
 # --- Smart Heartbeat ---
 _hb_times = os.getenv('HEARTBEAT_TIMES', '8:00').split(',')
 HEARTBEAT_TIMES = []
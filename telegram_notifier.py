@@ -4,271 +4,456 @@
 Telegram Notification Manager for NKON Monitor
 """
 
+import html
 import logging
+import re
 import time
-import hashlib
+import functools
+import itertools
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional, Set
+from typing import List, Dict, Optional, Set, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import settings
-from utils import extract_grade, shorten_name, mask_sensitive
+from utils import extract_grade, shorten_name, mask_sensitive, graph_id
 
 logger = logging.getLogger(__name__)
 
+TELEGRAM_API_URL = "https://api.telegram.org/"
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+_CHAT_ID_RE = re.compile(r'-?\d+$')
+# Джерело поточного часу (timestamp) для тихого часу та Heartbeat; тести підміняють його
+_now_ts = time.time
+
+def _coerce_chat(chat_id):
+    """Числові chat_id ("-100...", "123") передаються в API як int"""
+    if isinstance(chat_id, str) and _CHAT_ID_RE.match(chat_id):
+        return int(chat_id)
+    return chat_id
+
+def _esc(text, use_html: bool = False) -> str:
+    """Екранування тексту для HTML parse_mode (у Markdown текст не змінюється)"""
+    return html.escape(text, quote=False) if use_html and isinstance(text, str) else text
+
+def _link(text: str, url: str, use_html: bool = False) -> str:
+    if use_html:
+        return f'<a href="{html.escape(url)}">{text}</a>'
+    return f"[{text}]({url})"
+
+def _bold(text: str, use_html: bool = False) -> str:
+    return f"<b>{text}</b>" if use_html else f"*{text}*"
+
+def _code(text: str, use_html: bool = False) -> str:
+    return f"<code>{text}</code>" if use_html else f"`{text}`"
+
+def get_graph_link(item: Dict, use_html: bool = False) -> str:
+    if settings.VISUALIZATION_BASE_URL:
+        product_graph_id = graph_id(f"{item['link']}_{item.get('capacity', '0')}")
+        return " " + _link("📈Stat", f"{settings.VISUALIZATION_BASE_URL.rstrip('/')}/graph_{product_graph_id}.html", use_html)
+    return ""
+
+def get_grade_display(grade_str: str) -> str:
+    if grade_str == "?":
+        return ""
+    emoji = "🅰️" if "Grade A" in grade_str else "🅱️" if "Grade B" in grade_str else "❓"
+    if "-" in grade_str:
+        emoji += "➖"
+    return f"{emoji} {grade_str} | "
+
+@functools.lru_cache(maxsize=4096)
+def _item_markup(name: str, link: str, capacity, use_html: bool = False) -> tuple:
+    return get_grade_display(extract_grade(name)), _esc(shorten_name(name), use_html), _link(f"{capacity}Ah", link, use_html)
+
+def _enrich(item: Dict, use_html: bool = False) -> tuple:
+    """
+    Незмінні частини рядка товару: (grade_msg, short_name, link_text, graph_icon).
+    Рахуються один раз на товар і повторно використовуються всіма розділами
+    та отримувачами. Кеш не зберігається в самому item, щоб не потрапити в state.
+    """
+    return _item_markup(item['name'], item['link'], item['capacity'], use_html) + (get_graph_link(item, use_html),)
+
+_STATUS_MAP = {'preorder': 'Pre', 'in_stock': 'In', 'out_of_stock': 'Out'}
+_STATUS_EMOJI = {'in_stock': '✅', 'preorder': '📦', 'out_of_stock': '❌'}
+
+# Коди рішень _notify_decision та відповідні причини для _should_notify
+NOTIFY_CHANGES, NOTIFY_NO_QUIET, NOTIFY_FIRST_RUN, NOTIFY_HEARTBEAT, NOTIFY_COOLDOWN = range(5)
+_NOTIFY_REASONS = ("changes", "no_quiet", "first_run", "heartbeat", "cooldown")
+
+@functools.lru_cache(maxsize=16)
+def _quiet_hours_mask(start: int, end: int) -> int:
+    """Бітова маска тихого часу: біт h встановлений, якщо година h тиха"""
+    mask = 0
+    for h in range(24):
+        if start > end: # Перехід через північ (напр. 21 - 8)
+            quiet = h >= start or h < end
+        else: # В межах однієї доби
+            quiet = start <= h < end
+        if quiet:
+            mask |= 1 << h
+    return mask
+
+def _in_quiet_window(hour: int, start: int, end: int) -> bool:
+    return bool((_quiet_hours_mask(start, end) >> hour) & 1)
+
+@functools.lru_cache(maxsize=16)
+def _auto_cooldown_hours(heartbeat_times: tuple) -> float:
+    """
+    Автоматичний кулдаун Heartbeat: найменший проміжок між сусідніми
+    слотами розкладу (з переходом через північ), у годинах.
+    Один слот (або порожній розклад) — 24 години.
+    """
+    minutes = sorted({t.hour * 60 + t.minute for t in heartbeat_times})
+    if not minutes:
+        return 24.0
+    gaps = [b - a for a, b in zip(minutes, minutes[1:])]
+    gaps.append(minutes[0] + 24 * 60 - minutes[-1])
+    return min(gaps) / 60
+
+def _notify_decision(has_changes: bool, quiet_mode: bool, last_notification_time: Union[datetime, float, None],
+                     now_ts: float, heartbeat_hours: float) -> int:
+    """
+    Логіка Heartbeat/Quiet mode: повертає код рішення NOTIFY_*.
+    last_notification_time — datetime або timestamp; None, datetime.min чи дата до епохи
+    означають, що сповіщень ще не було.
+    """
+    if has_changes:
+        return NOTIFY_CHANGES
+    if not quiet_mode:
+        return NOTIFY_NO_QUIET
+    if last_notification_time is None:
+        last_ts = -1.0
+    elif isinstance(last_notification_time, datetime):
+        # datetime.min (початковий стан монітора) не має timestamp(): ValueError
+        last_ts = last_notification_time.timestamp() if last_notification_time.year >= 1970 else -1.0
+    else:
+        last_ts = float(last_notification_time) if last_notification_time else 0
+    if last_ts < 0:
+        return NOTIFY_FIRST_RUN
+    if (now_ts - last_ts) / 3600 >= heartbeat_hours:
+        return NOTIFY_HEARTBEAT
+    return NOTIFY_COOLDOWN
+
 class TelegramNotifier:
     LINE_PREFIX = "└──▷"
+    TIMESTAMP_FORMAT = '%d.%m.%Y %H:%M:%S'
 
     def __init__(self, config: Dict, session: requests.Session = None):
         self.config = config
         self.session = session or requests.Session()
+        # Пул з'єднань з Keep-Alive для Telegram API: послідовні запити
+        # перевикористовують TLS-з'єднання. sendMessage/editMessageText не ідемпотентні:
+        # повторюються лише помилки з'єднання та 429 (з Retry-After). Після таймауту читання
+        # чи 5xx повідомлення могло вже дійти, тому повтор дав би дублікат у каналі
+        retry = Retry(total=3, connect=3, read=0, backoff_factor=0.3, status_forcelist=[429],
+                      allowed_methods={"POST"}, raise_on_status=False)
+        self.session.mount(TELEGRAM_API_URL, HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+        bot_token = self.config.get('telegram_bot_token')
+        self._send_url = f"{TELEGRAM_API_URL}bot{bot_token}/sendMessage"
+        self._edit_url = f"{TELEGRAM_API_URL}bot{bot_token}/editMessageText"
+        self._quiet_cache = (0.0, False) # (час перевірки, результат) для is_quiet_hours
+        self._footer_cache = (None, "") # (кортеж посилань, готовий футер) для format_footer
+        # Інтервал Heartbeat за замовчуванням — автоматичний кулдаун за розкладом (рахується один раз)
+        self._default_heartbeat_hours = _auto_cooldown_hours(
+            tuple(self.config.get('heartbeat_times', settings.HEARTBEAT_TIMES)))
+        # HTML не потребує екранування _*[] як Markdown і дає коротший текст
+        raw_parse_mode = self.config.get('parse_mode', settings.TELEGRAM_PARSE_MODE)
+        self.parse_mode = settings.TELEGRAM_PARSE_MODES.get(str(raw_parse_mode).strip().lower())
+        if self.parse_mode is None:
+            logger.error(f"❌ Непідтримуваний parse_mode {raw_parse_mode!r} (очікується Markdown або HTML), використовується Markdown")
+            self.parse_mode = 'Markdown'
+        self._use_html = self.parse_mode == 'HTML'
+        self._header = "🔋 " + self.bold("NKON LiFePO4 Monitor") + "\n\n"
+        # Залишок без real_stock залежить лише від статусу; з real_stock — шаблон "[N шт]"
+        self._status_stock_display = {'in_stock': " " + self.code("[В\u00a0наявності]")}
+        self._stock_template = " " + self.code("[{} шт]")
+        # Шаблони заголовків розділів для поточного parse_mode (будуються один раз)
+        self._section_headers = {
+            section: f"{emoji} " + self.bold(title) + "\n" for section, emoji, title in (
+                ('new', "✨", "Нові товари ({count}):"),
+                ('price_changes', "💰", "Зміни цін ({count}):"),
+                ('status_changes', "📦", "Зміни статусу({count}):"),
+                ('removed', "❌", "Видалені ({count}):"),
+                ('unchanged', "📋", "{hdr} ({count}):"),
+            )
+        }
+
+    def bold(self, text: str) -> str:
+        return _bold(text, self._use_html)
+
+    def code(self, text: str) -> str:
+        return _code(text, self._use_html)
+
+    def link(self, text: str, url: str) -> str:
+        return _link(text, url, self._use_html)
+
+    def escape(self, text) -> str:
+        return _esc(text, self._use_html)
 
     def is_quiet_hours(self) -> bool:
-        """Перевіряє, чи активний зараз тихий час (за замовчуванням 21:00 - 08:00)"""
-        now = datetime.now()
+        """Перевіряє, чи активний зараз тихий час (за замовчуванням 21:00 - 08:00).
+        Результат кешується на 60 секунд."""
+        now_ts = _now_ts()
+        cached_ts, value = self._quiet_cache
+        if 0 <= now_ts - cached_ts < 60: # Після переведення годинника назад кеш не діє
+            return value
+        
+        hour = time.localtime(now_ts).tm_hour
         start = self.config.get('quiet_hours_start', settings.QUIET_HOURS_START)
         end = self.config.get('quiet_hours_end', settings.QUIET_HOURS_END)
         
-        if start > end: # Перехід через північ (напр. 21 - 8)
-            return now.hour >= start or now.hour < end
-        else: # В межах однієї доби
-            return start <= now.hour < end
+        value = _in_quiet_window(hour, start, end)
+        self._quiet_cache = (now_ts, value)
+        return value
 
-    def _format_stock_display(self, item: Dict, show_diffs: bool = True, msg_key: str = None, stock_cumulative_diffs: Dict = None) -> str:
-        """Формує рядок залишку."""
-        if item.get('real_stock') is None:
-            if item.get('stock_status') == 'in_stock':
-                return " `[В\u00a0наявності]`"
-            return ""
-            
-        current = item['real_stock']
+    def _format_stock_display(self, item: Dict, show_diffs: bool = True, msg_key: str = None, stock_cumulative_diffs: Dict = None,
+                              rec_diffs: Dict = None) -> str:
+        """Формує рядок залишку. rec_diffs — вже вибрані дельти отримувача (замість пошуку за msg_key)."""
+        current = item.get('real_stock')
+        if current is None:
+            return self._status_stock_display.get(item.get('stock_status'), "")
         
-        if not show_diffs or not msg_key or not stock_cumulative_diffs:
-            return f" `[{current} шт]`"
+        if rec_diffs is None and show_diffs and msg_key and stock_cumulative_diffs:
+            rec_diffs = stock_cumulative_diffs.get(msg_key)
         
-        key = f"{item['link']}_{item.get('capacity', '0')}"
-        rec_diffs = stock_cumulative_diffs.get(msg_key, {})
-        diffs = rec_diffs.get(key, {"decrease": 0, "increase": 0})
+        diffs = rec_diffs.get(f"{item['link']}_{item.get('capacity', '0')}") if rec_diffs else None
+        if diffs:
+            dec = diffs["decrease"]
+            inc = diffs["increase"]
+            if dec or inc:
+                dec_s = str(dec) if dec else ""
+                inc_s = f"+{inc}" if inc else ""
+                return self._stock_template.format(f"{current}({dec_s}{inc_s})")
+        return self._stock_template.format(current)
+
+    def _format_line(self, item: Dict, rec_diffs: Dict = None, prefix_emoji: str = "•") -> str:
+        """Рядок товару з ціною, статусом та залишком. rec_diffs=None — без дельт залишку."""
+        grade_msg, short_name, link_text, graph_icon = _enrich(item, self._use_html)
+        price = self.escape(item.get('price', 'N/A'))
         
-        dec = diffs["decrease"]
-        inc = diffs["increase"]
+        stock_msg = self._format_stock_display(item, rec_diffs=rec_diffs)
         
-        if dec != 0 or inc != 0:
-            diff_str = ""
-            if dec != 0: diff_str += str(dec)
-            if inc != 0: diff_str += f"+{inc}"
-            return f" `[{current}({diff_str}) шт]`"
+        status_ico = ""
+        delivery_msg = ""
+        
+        if item.get('stock_status') == 'preorder':
+            status_ico = " " + self.link("📦Pre", item['link'])
+            if item.get('delivery_date'):
+                delivery_msg = "\n  " + self.link(f"{self.LINE_PREFIX} {self.escape(item['delivery_date'])}", item['link']) + stock_msg
+            else:
+                status_ico += stock_msg
+        elif item.get('stock_status') == 'in_stock':
+            status_ico = " " + self.link("✅In", item['link'])
+            if stock_msg:
+                delivery_msg = "\n  " + self.link(f"{self.LINE_PREFIX} В\u00a0наявності", item['link']) + stock_msg
+            else:
+                status_ico += stock_msg
+        elif item.get('stock_status') == 'out_of_stock':
+            status_ico = f" ❌Out{stock_msg}"
             
-        return f" `[{current} шт]`"
+        return f"{prefix_emoji} {link_text} {grade_msg}{short_name} | {price}{status_ico}{delivery_msg}{graph_icon}"
+
+    def _fmt_price_change(self, item: Dict, threshold: float) -> str:
+        """Рядок розділу 'Зміни цін'"""
+        old_price = self.escape(item.get('old_price', 'N/A'))
+        new_price = self.escape(item.get('new_price', 'N/A'))
+        change_str = f"{old_price} → {new_price}"
+        old_val = item.get('old_price_value')
+        new_val = item.get('new_price_value')
+        
+        if old_val and new_val:
+            try:
+                change_percent = ((new_val - old_val) / old_val) * 100
+                if abs(change_percent) >= threshold:
+                    emoji = "🔴" if change_percent > 0 else "🟢"
+                    sign = "+" if change_percent > 0 else ""
+                    change_str += f" ({emoji}{sign}{change_percent:.1f}%)"
+            except ZeroDivisionError:
+                pass
+        
+        grade_msg, short_name, link_text, graph_icon = _enrich(item, self._use_html)
+        return f"• {link_text} {grade_msg}{short_name} | {change_str}{graph_icon}"
+
+    def _fmt_status_change(self, item: Dict) -> str:
+        """Рядок розділу 'Зміни статусу'"""
+        new_status = item.get('new_status')
+        old_status = item.get('old_status')
+        price = self.escape(item.get('price', 'N/A'))
+        status_emoji = _STATUS_EMOJI.get(new_status, "📦")
+        old_str = _STATUS_MAP.get(old_status, 'Out')
+        new_str = _STATUS_MAP.get(new_status, 'Out')
+        
+        status_info = f" | {old_str} → {new_str}" if old_status != new_status else ""
+        
+        date_msg = ""
+        old_date = self.escape(item.get('old_date'))
+        new_date = self.escape(item.get('new_date'))
+        if new_date:
+            if old_date and old_date != new_date:
+                date_msg = f"\n  {self.LINE_PREFIX} {old_date} → {new_date}"
+            else:
+                date_msg = f"\n  {self.LINE_PREFIX} {new_date}"
+        
+        grade_msg, short_name, link_text, graph_icon = _enrich(item, self._use_html)
+        return f"• {status_emoji} {link_text} {grade_msg}{short_name}{status_info}{date_msg} | {price}{graph_icon}"
+
+    def _fmt_removed(self, item: Dict) -> str:
+        """Рядок розділу 'Видалені'"""
+        _, short_name, link_text, graph_icon = _enrich(item, self._use_html)
+        return f"• {link_text} {short_name}{graph_icon}"
 
     def format_telegram_message(self, changes: Dict, include_unchanged: bool = True, is_update: bool = False, 
                                show_stock_diffs: bool = False, unchanged_header: str = "Без змін", 
                                msg_key: str = None, header_link: str = None, footer_links: list = None,
-                               stock_cumulative_diffs: Dict = None) -> Optional[str]:
+                               stock_cumulative_diffs: Dict = None, formatted_now: str = None) -> Optional[str]:
         """
-        Форматування повідомлення для Telegram
+        Форматування повідомлення для Telegram.
+        formatted_now — готовий час для футера (один на всю розсилку); None -> поточний час.
         """
+        has_changes = bool(changes.get('new') or changes.get('price_changes')
+                           or changes.get('status_changes') or changes.get('removed'))
+        # Без змін і без повного списку — нічого не форматуємо
+        if not has_changes and not include_unchanged:
+            return None
+        
+        # Фрагменти повідомлення збираються у список і з'єднуються один раз у кінці
+        parts = []
         if header_link:
-            msg = f"[🔋 NKON LiFePO4 Monitor]({header_link})\n\n"
+            parts.append(self.link("🔋 NKON LiFePO4 Monitor", header_link) + "\n\n")
         else:
-            msg = f"🔋 *NKON LiFePO4 Monitor*\n\n"
+            parts.append(self._header)
         
-        has_changes = False
         threshold = self.config.get('price_alert_threshold', 5)
+        # Дельти залишків цього отримувача вибираються один раз на повідомлення
+        rec_diffs = None
+        if show_stock_diffs and msg_key and stock_cumulative_diffs:
+            rec_diffs = stock_cumulative_diffs.get(msg_key, {})
         
-        def get_grade_display(grade_str: str) -> str:
-            if grade_str == "?":
-                return ""
-            emoji = "🅰️" if "Grade A" in grade_str else "🅱️" if "Grade B" in grade_str else "❓"
-            if "-" in grade_str:
-                emoji += "➖"
-            return f"{emoji} {grade_str} | "
-
-        def get_graph_link(item: Dict) -> str:
-            if settings.VISUALIZATION_BASE_URL:
-                p_key = f"{item['link']}_{item.get('capacity', '0')}"
-                graph_id = hashlib.md5(p_key.encode()).hexdigest()[:8]
-                graph_url = f"{settings.VISUALIZATION_BASE_URL.rstrip('/')}/graph_{graph_id}.html"
-                return f" [📈Stat]({graph_url})"
-            return ""
-
-        def format_line(item, prefix_emoji="", show_status=False):
-            grade = extract_grade(item['name'])
-            short_name = shorten_name(item['name'])
-            price = item.get('price', 'N/A')
-            grade_msg = get_grade_display(grade)
-            
-            stock_msg = self._format_stock_display(item, show_diffs=show_stock_diffs, msg_key=msg_key, stock_cumulative_diffs=stock_cumulative_diffs)
-            
-            status_ico = ""
-            delivery_msg = ""
-            
-            if item.get('stock_status') == 'preorder':
-                status_ico = f" [📦Pre]({item['link']})"
-                if item.get('delivery_date'):
-                    delivery_msg = f"\n  [{self.LINE_PREFIX} {item['delivery_date']}]({item['link']}){stock_msg}"
-                else:
-                    status_ico += stock_msg
-            elif item.get('stock_status') == 'in_stock':
-                status_ico = f" [✅In]({item['link']})"
-                if stock_msg:
-                    delivery_msg = f"\n  [{self.LINE_PREFIX} В\u00a0наявності]({item['link']}){stock_msg}"
-                else:
-                    status_ico += stock_msg
-            elif item.get('stock_status') == 'out_of_stock':
-                status_ico = f" ❌Out{stock_msg}"
-                
-            link_text = f"[{item['capacity']}Ah]({item['link']})"
-            graph_icon = get_graph_link(item)
-            return f"{prefix_emoji} {link_text} {grade_msg}{short_name} | {price}{status_ico}{delivery_msg}{graph_icon}"
-
-        if changes.get('new'):
-            has_changes = True
-            msg += f"✨ *Нові товари ({len(changes['new'])}):*\n"
-            for item in changes['new']:
-                msg += format_line(item, "•") + "\n"
-            msg += "\n"
-        
-        if changes.get('price_changes'):
-            has_changes = True
-            msg += f"💰 *Зміни цін ({len(changes['price_changes'])}):*\n"
-            for item in changes['price_changes']:
-                old_price = item.get('old_price', 'N/A')
-                new_price = item.get('new_price', 'N/A')
-                change_str = f"{old_price} → {new_price}"
-                old_val = item.get('old_price_value')
-                new_val = item.get('new_price_value')
-                
-                if old_val and new_val:
-                    try:
-                        change_percent = ((new_val - old_val) / old_val) * 100
-                        if abs(change_percent) >= threshold:
-                            emoji = "🔴" if change_percent > 0 else "🟢"
-                            sign = "+" if change_percent > 0 else ""
-                            change_str += f" ({emoji}{sign}{change_percent:.1f}%)"
-                    except ZeroDivisionError:
-                        pass
-                
-                grade = extract_grade(item['name'])
-                grade_msg = get_grade_display(grade)
-                short_name = shorten_name(item['name'])
-                link_text = f"[{item['capacity']}Ah]({item['link']})"
-                graph_icon = get_graph_link(item)
-                msg += f"• {link_text} {grade_msg}{short_name} | {change_str}{graph_icon}\n"
-            msg += "\n"
-        
-        if changes.get('status_changes'):
-            has_changes = True
-            msg += f"📦 *Зміни статусу({len(changes['status_changes'])}):*\n"
-            for item in changes['status_changes']:
-                new_status = item.get('new_status')
-                old_status = item.get('old_status')
-                price = item.get('price', 'N/A')
-                status_map = {'preorder': 'Pre', 'in_stock': 'In', 'out_of_stock': 'Out'}
-                status_emoji = "✅" if new_status == 'in_stock' else "📦"
-                old_str = status_map.get(old_status, 'Out')
-                new_str = status_map.get(new_status, 'Out')
-                
-                status_info = f" | {old_str} → {new_str}" if old_status != new_status else ""
-                
-                date_msg = ""
-                old_date = item.get('old_date')
-                new_date = item.get('new_date')
-                if new_date:
-                    if old_date and old_date != new_date:
-                        date_msg = f"\n  {self.LINE_PREFIX} {old_date} → {new_date}"
-                    else:
-                        date_msg = f"\n  {self.LINE_PREFIX} {new_date}"
-                
-                grade_raw = extract_grade(item['name'])
-                grade_msg = get_grade_display(grade_raw)
-                short_name = shorten_name(item['name'])
-                link_text = f"[{item['capacity']}Ah]({item['link']})"
-                graph_icon = get_graph_link(item)
-                msg += f"• {status_emoji} {link_text} {grade_msg}{short_name}{status_info}{date_msg} | {price}{graph_icon}\n"
-            msg += "\n"
-        
-        if changes.get('removed'):
-            has_changes = True
-            msg += f"❌ *Видалені ({len(changes['removed'])}):*\n"
-            for item in changes['removed']:
-                link_text = f"[{item['capacity']}Ah]({item['link']})"
-                graph_icon = get_graph_link(item)
-                msg += f"• {link_text} {shorten_name(item['name'])}{graph_icon}\n"
-            msg += "\n"
-            
-        if not has_changes and not include_unchanged:
-            return None
-        
-        changed_links = set()
-        for item in changes.get('new', []): changed_links.add(item['link'])
-        for item in changes.get('price_changes', []): changed_links.add(item['link'])
-        for item in changes.get('status_changes', []): changed_links.add(item['link'])
+        sections = (
+            ('new', lambda item: self._format_line(item, rec_diffs)),
+            ('price_changes', lambda item: self._fmt_price_change(item, threshold)),
+            ('status_changes', self._fmt_status_change),
+            ('removed', self._fmt_removed),
+        )
+        for section, fmt in sections:
+            items = changes.get(section)
+            if items:
+                parts.append(self._section_headers[section].format(count=len(items)))
+                parts.append("\n".join(map(fmt, items)))
+                parts.append("\n\n")
         
         if include_unchanged:
-            current = changes.get('current', [])
-            unchanged = [p for p in current if p['link'] not in changed_links]
+            changed_links = {item['link'] for item in itertools.chain(
+                changes.get('new', ()), changes.get('price_changes', ()), changes.get('status_changes', ()))}
+            unchanged = [p for p in changes.get('current', ()) if p['link'] not in changed_links]
             if unchanged:
-                msg += f"📋 *{unchanged_header} ({len(unchanged)}):*\n"
-                for item in unchanged:
-                    msg += format_line(item, "•") + "\n"
+                parts.append(self._section_headers['unchanged'].format(hdr=self.escape(unchanged_header), count=len(unchanged)))
+                parts.append("\n".join(self._format_line(item, rec_diffs) for item in unchanged))
         
-        msg = msg.strip()
+        msg = ''.join(parts).strip()
         status_emoji = "🆕" if not is_update else "🔄"
-        msg += f"\n\n{status_emoji} {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
-        
-        if footer_links:
-            links_list = [f"[{link.get('name', 'Чат')}]({link['url']})" for link in footer_links if link.get('url')]
-            if links_list:
-                msg += f"\n\n💬 Обговорення: " + " | ".join(links_list)
-        return msg
+        if formatted_now is None:
+            formatted_now = datetime.now().strftime(self.TIMESTAMP_FORMAT)
+        return f"{msg}\n\n{status_emoji} {formatted_now}{self.format_footer(footer_links)}"
+
+    def format_footer(self, footer_links: list = None) -> str:
+        """Блок посилань на обговорення (порожній рядок, якщо посилань немає)"""
+        if not footer_links:
+            return ""
+        # Незмінний кортеж (settings.FOOTER_LINKS) рендериться один раз на всі повідомлення розсилки
+        cached_links, cached_footer = self._footer_cache
+        if footer_links is cached_links:
+            return cached_footer
+        links_list = [self.link(self.escape(link.get('name', 'Чат')), link['url']) for link in footer_links if link.get('url')]
+        footer = "\n\n💬 Обговорення: " + " | ".join(links_list) if links_list else ""
+        if isinstance(footer_links, tuple):
+            self._footer_cache = (footer_links, footer)
+        return footer
+
+    def format_no_changes_message(self, formatted_now: str, header_link: str = None, footer_links: list = None) -> str:
+        """Коротке повідомлення 'Без змін' для тихого редагування"""
+        header = self.link("🔋 NKON Monitor", header_link) if header_link else "🔋 " + self.bold("NKON Monitor")
+        return f"{header}\n\n📋 Без змін\n\n🕒 {formatted_now}{self.format_footer(footer_links)}"
+
+    def _post_json(self, url: str, payload: Dict) -> requests.Response:
+        """POST з JSON-тілом; orjson (якщо встановлений) серіалізує одразу в UTF-8 bytes"""
+        if orjson is not None:
+            return self.session.post(url, data=orjson.dumps(payload), headers=_JSON_HEADERS, timeout=15)
+        return self.session.post(url, json=payload, timeout=15)
 
     def send_telegram_message(self, text: str, chat_ids: Set[str] = None, thread_id: int = None, 
                               dry_run: bool = False, disable_notification: bool = False) -> Dict[str, int]:
         """Відправлення повідомлення в Telegram групі отримувачів"""
+        if not chat_ids:
+            if not self.config.get('telegram_bot_token'): logger.error("Telegram bot token не налаштований")
+            return {}
+        return self.send_bulk(text, [(chat_id, thread_id) for chat_id in chat_ids],
+                              dry_run=dry_run, disable_notification=disable_notification)
+
+    def send_bulk(self, text: str, targets: List[Tuple[str, Optional[int]]],
+                  dry_run: bool = False, disable_notification: bool = False) -> Dict[str, int]:
+        """
+        Відправлення одного й того ж тексту в кілька чатів/топіків паралельно.
+        targets: список (chat_id, thread_id). Повертає {chat_id: message_id}.
+        """
         sent_messages = {}
         bot_token = self.config.get('telegram_bot_token')
-        if not bot_token or not chat_ids: 
+        if not bot_token or not targets: 
             if not bot_token: logger.error("Telegram bot token не налаштований")
             return sent_messages
         
+        # Примусово вимикаємо звук, якщо зараз тихий час
+        is_silent = disable_notification or self.is_quiet_hours()
+        
         if dry_run:
-            logger.info(f"[DRY RUN] Telegram повідомлення для {[mask_sensitive(c) for c in chat_ids]} (silent={disable_notification or self.is_quiet_hours()}):\n{text}")
+            # Маскування chat_id виконується лише якщо лог INFO реально буде записано
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[DRY RUN] Telegram повідомлення для %s (silent=%s):\n%s",
+                            [mask_sensitive(c) for c, _ in targets], is_silent, text)
             return sent_messages
 
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        url = self._send_url
+        # Спільна частина payload будується один раз для всіх отримувачів
+        base_payload = {
+            "text": text,
+            "parse_mode": self.parse_mode,
+            "disable_web_page_preview": True,
+            "disable_notification": is_silent
+        }
         
-        for chat_id in chat_ids:
-            masked_chat = mask_sensitive(chat_id)
-            target_chat = chat_id
-            if isinstance(chat_id, str):
-                if (chat_id.startswith('-') and chat_id[1:].isdigit()) or chat_id.isdigit():
-                    target_chat = int(chat_id)
-            
-            # Примусово вимикаємо звук, якщо зараз тихий час
-            is_silent = disable_notification or self.is_quiet_hours()
-            
-            payload = {
-                "chat_id": target_chat,
-                "text": text,
-                "parse_mode": "Markdown",
-                "disable_web_page_preview": True,
-                "disable_notification": is_silent
-            }
+        def post(target):
+            chat_id, thread_id = target
+            payload = {**base_payload, "chat_id": _coerce_chat(chat_id)}
             if thread_id:
                 payload["message_thread_id"] = thread_id
                 
             try:
-                response = self.session.post(url, json=payload, timeout=15)
-                result = response.json()
-                if result.get("ok"):
-                    msg_id = result["result"]["message_id"]
-                    sent_messages[chat_id] = msg_id
-                    logger.info(f"✅ Повідомлення відправлено до чату {masked_chat}")
-                else:
-                    logger.error(f"❌ Помилка Telegram для {masked_chat}: {result.get('description')}")
+                response = self._post_json(url, payload)
+                return chat_id, response.json()
             except Exception as e:
-                logger.error(f"❌ Помилка при відправці до чату {masked_chat}: {e}")
+                return chat_id, e
+        
+        # Запити до різних чатів незалежні (I/O), тому відправляємо їх паралельно
+        with ThreadPoolExecutor(max_workers=min(8, len(targets))) as executor:
+            results = list(executor.map(post, targets))
+        
+        for chat_id, result in results:
+            masked_chat = mask_sensitive(chat_id)
+            if isinstance(result, Exception):
+                logger.error(f"❌ Помилка при відправці до чату {masked_chat}: {result}")
+            elif result.get("ok"):
+                msg_id = result["result"]["message_id"]
+                sent_messages[chat_id] = msg_id
+                logger.info(f"✅ Повідомлення відправлено до чату {masked_chat}")
+            else:
+                logger.error(f"❌ Помилка Telegram для {masked_chat}: {result.get('description')}")
         
         return sent_messages
 
@@ -277,54 +462,29 @@ class TelegramNotifier:
         bot_token = self.config.get('telegram_bot_token')
         if not bot_token: return False
         
-        target_chat = chat_id
-        if isinstance(chat_id, str):
-            if (chat_id.startswith('-') and chat_id[1:].isdigit()) or chat_id.isdigit():
-                target_chat = int(chat_id)
-        
-        url = f"https://api.telegram.org/bot{bot_token}/editMessageText"
+        url = self._edit_url
         payload = {
-            "chat_id": target_chat,
+            "chat_id": _coerce_chat(chat_id),
             "message_id": message_id,
             "text": text,
-            "parse_mode": "Markdown",
+            "parse_mode": self.parse_mode,
             "disable_web_page_preview": True
         }
         try:
-            response = self.session.post(url, json=payload, timeout=15)
+            response = self._post_json(url, payload)
             result = response.json()
             return result.get("ok", False)
         except Exception as e:
             logger.error(f"❌ Помилка при редагуванні в Telegram: {e}")
         return False
 
-    def _should_notify(self, recipient_config: Dict, has_changes: bool, last_notification_time: Optional[float]) -> tuple:
+    def _should_notify(self, recipient_config: Dict, has_changes: bool, last_notification_time: Optional[datetime]) -> tuple:
         """
         Перевірка, чи потрібно відправляти повідомлення згідно з логікою Heartbeat/Quiet mode
         Повертає: (should_notify: bool, reason: str)
         """
-        if has_changes:
-            return True, "changes"
-            
         quiet_mode = recipient_config.get('quiet_mode', False)
-        if not quiet_mode:
-            return True, "no_quiet"
-            
-        # Якщо Quiet mode включений, перевіряємо кулдаун для Heartbeat
-        heartbeat_hours = recipient_config.get('heartbeat_interval_hours', settings.DEFAULT_HEARTBEAT_INTERVAL)
-        
-        if last_notification_time is None:
-            return True, "first_run"
-            
-        # Якщо last_notification_time це datetime
-        if isinstance(last_notification_time, datetime):
-            last_ts = last_notification_time.timestamp()
-        else:
-            last_ts = float(last_notification_time) if last_notification_time else 0
-            
-        elapsed_hours = (time.time() - last_ts) / 3600
-        if elapsed_hours >= heartbeat_hours:
-            return True, "heartbeat"
-            
-        return False, "cooldown"
+        heartbeat_hours = recipient_config.get('heartbeat_interval_hours', self._default_heartbeat_hours)
+        decision = _notify_decision(has_changes, quiet_mode, last_notification_time, _now_ts(), heartbeat_hours)
+        return decision != NOTIFY_COOLDOWN, _NOTIFY_REASONS[decision]
 
@@ -1,21 +1,128 @@
-import re
+import io
 import sys
+import types
+import contextlib
+import unittest.mock
+import pytest
+from datetime import datetime, time as dt_time, timedelta
+import settings
 from nkon_monitor import NkonMonitor
-from utils import extract_capacity, clean_price
+from telegram_notifier import TelegramNotifier, _in_quiet_window
+from utils import extract_capacity, clean_price, parse_delivery_date, extract_grade
+
+# Fixed times for Heartbeat tests (built once, reused by TEST 7/8)
+T_0700, T_0800, T_1200, T_1600, T_1800, T_2000 = (dt_time(h, 0) for h in (7, 8, 12, 16, 18, 20))
+BASE_DATE = datetime(2025, 1, 1, 12, 0)
+DT_0730 = datetime(2025, 1, 1, 7, 30)
+DT_0805 = datetime(2025, 1, 1, 8, 5)
+DT_1610 = datetime(2025, 1, 1, 16, 10)
+DT_1630 = datetime(2025, 1, 1, 16, 30)
+DT_2000 = datetime(2025, 1, 1, 20, 0)
+
+# TEST 8: heartbeat schedule -> expected auto cooldown (hours)
+AUTO_COOLDOWN_CASES = (
+    ([T_0800], 24.0),
+    ([T_0800, T_2000], 12.0),
+    ([T_0800, T_1200, T_1600], 4.0),
+    ([T_0700, T_1200, T_1800], 5.0), # 7-12=5, 12-18=6, 18-7=13
+)
+
+@contextlib.contextmanager
+def _mock_datetime(now):
+    """Freezes the monitor and notifier clocks (nkon_monitor._now, telegram_notifier._now_ts);
+    set clock.now to move them inside the block"""
+    clock = types.SimpleNamespace(now=now)
+    with unittest.mock.patch('nkon_monitor._now', lambda: clock.now), \
+         unittest.mock.patch('telegram_notifier._now_ts', lambda: clock.now.timestamp()):
+        yield clock
 
 # Mock monitor to test methods without initializing Selenium or Config
 class MockMonitor(NkonMonitor):
+    state_file = 'state_test.json'
+    session = None
+
     def __init__(self):
         self.config = {}
-        self.session = None
         self.previous_state = {}
         self.last_messages = {}
         self.stock_cumulative_diffs = {}
-        self.state_file = 'state_test.json'
+        # Message formatting and the heartbeat decision live in the real notifier
+        self.telegram = TelegramNotifier({'parse_mode': 'Markdown'})
+
+    def reset(self):
+        """Очищає стан між тестами без створення нового екземпляра"""
+        self.config.clear()
+        self.previous_state.clear()
+        self.last_messages.clear()
+        self.stock_cumulative_diffs.clear()
 
     def send_telegram_message(self, message: str, chat_ids: set = None, dry_run: bool = False, disable_notification: bool = False):
         return {"123": 456}
 
+# TEST 1-3: parser input -> expected result (None = must not parse)
+CAPACITY_CASES = [
+    ('Eve LF280K 280Ah', 280),
+    ('280 Ah', 280),
+    ('280  Ah', 280),
+    ('314ah', 314),
+    ('280AHgrade B', 280),
+    ('99Ah', None), # Fewer than 3 digits is not a cell capacity
+    ('100Ah', 100),
+    ('REPT 324Ah', 324),
+    ('Eve LF230 - 230Аг', 230),
+    ('230 аг', 230),
+    ('230 АГ', 230),
+]
+PRICE_CASES = [
+    ('€ 89.95', 89.95),
+    ('€89.95', 89.95),
+    ('€ 89,95', 89.95),
+    ('€1,234.50', None), # Thousands separator turns into a second dot
+    ('N/A', None),
+    ('Price: 100', 100.0),
+    ('89.95', 89.95),
+]
+DELIVERY_DATE_CASES = [
+    ('Орієнтовна дата доставки:27-03-2026', '27-03-2026'),
+    ('Орієнтовна дата доставки: 15-04-2026', '15-04-2026'),
+    ('Орієнтовна дата доставки:10-3-2026', '10-03-2026'),
+    ('27-03-2026', '27-03-2026'),
+    ('Something else 12-12-2025', '12-12-2025'),
+    ('No date here', None),
+]
+
+def _report(title, func, cases):
+    """Prints a ✅/❌ line per case for the script run (pytest asserts the same tables)"""
+    print(f'\n--- {title} ---')
+    for text, expected in cases:
+        res = func(text)
+        print(f'{"✅" if res == expected else "❌"} "{text}" -> {res} (expected {expected})')
+
+@pytest.mark.parametrize("text,expected", CAPACITY_CASES)
+def test_extract_capacity(text, expected):
+    """TEST 1: capacity regex (does not need the monitor)"""
+    assert extract_capacity(text) == expected
+
+@pytest.mark.parametrize("text,expected", PRICE_CASES)
+def test_clean_price(text, expected):
+    """TEST 2: price parsing"""
+    assert clean_price(text) == expected
+
+@pytest.mark.parametrize("text,expected", DELIVERY_DATE_CASES)
+def test_delivery_date(text, expected):
+    """TEST 3: delivery date parsing"""
+    assert parse_delivery_date(text) == expected
+
+def test_quiet_mode_first_run():
+    """TEST 7a: quiet mode on a fresh state (last_notification_time = datetime.min)"""
+    print('\n--- TEST 7a: Quiet Mode First Run (datetime.min) ---')
+    notifier = TelegramNotifier({})
+    # A fresh monitor state stores datetime.min, which has no timestamp()
+    res = notifier._should_notify({'quiet_mode': True}, False, datetime.min)
+    status = "✅" if res == (True, "first_run") else "❌"
+    print(f'{status} datetime.min -> {res}')
+    assert res == (True, "first_run")
+
 def run_tests():
     print("Initializing MockMonitor for Unit Testing...")
     try:
@@ -24,64 +131,11 @@ def run_tests():
         print(f"Error initializing monitor: {e}")
         return
 
-    # Test 1: Regex
-    print('\n--- TEST 1: Regex Capacity ---')
-    test_cases = [
-        'Eve LF280K 280Ah', 
-        '280 Ah', 
-        '280  Ah', 
-        '314ah', 
-        '280AHgrade B', 
-        '99Ah', 
-        '100Ah',
-        'REPT 324Ah',
-        'Eve LF230 - 230Аг',
-        '230 аг',
-        '230 АГ'
-    ]
-    
-    for test in test_cases:
-        res = extract_capacity(test)
-        status = "✅" if res else "❌"
-        print(f'{status} "{test}" -> {res}')
-
-    # Test 2: Clean Price
-    print('\n--- TEST 2: Clean Price ---')
-    prices = [
-        '€ 89.95', 
-        '€89.95', 
-        '€ 89,95', 
-        '€1,234.50', 
-        'N/A', 
-        'Price: 100',
-        '89.95'
-    ]
-    
-    for p in prices:
-        res = clean_price(p)
-        status = "✅" if res is not None else "❌"
-        print(f'{status} "{p}" -> {res}')
-
-    # Test 3: Delivery Date
-    print('\n--- TEST 3: Delivery Date ---')
-    dates = [
-        'Орієнтовна дата доставки:27-03-2026',
-        'Орієнтовна дата доставки: 15-04-2026',
-        'Орієнтовна дата доставки:10-3-2026',
-        '27-03-2026',
-        'Something else 12-12-2025',
-        'No date here'
-    ]
-    
-    for d in dates:
-        match = re.search(r'(\d{1,2})-(\d{1,2})-(\d{4})', d)
-        if match:
-            day, month, year = match.groups()
-            res = f"{int(day):02d}-{int(month):02d}-{year}"
-        else:
-            res = None
-        status = "✅" if res else "❌"
-        print(f'{status} "{d}" -> {res}')
+    # Tests 1-3: pure parsers (pytest runs the same tables as parametrized asserts)
+    _report('TEST 1: Regex Capacity', extract_capacity, CAPACITY_CASES)
+    _report('TEST 2: Clean Price', clean_price, PRICE_CASES)
+    _report('TEST 3: Delivery Date', parse_delivery_date, DELIVERY_DATE_CASES)
+    test_quiet_mode_first_run()
 
     # Test 4: Stock Counters
     print('\n--- TEST 4: Stock Counters (Sales, Returns, Restocks) ---')
@@ -93,43 +147,43 @@ def run_tests():
         'name': 'Eve LF280K 280Ah',
         'real_stock': 100
     }
-    key = f"{test_link}_280"
+    key = test_link + "_280"
     
     # 1. Start: stock=100 (first time seen)
     print("1. Initializing with 100...")
-    monitor._update_stock_counters([test_item], "test_key")
-    print(f"   Diffs: {monitor.stock_cumulative_diffs.get(key)}")
+    # No previous stock yet, so nothing is counted and no diff entry is touched
+    touched = monitor._update_stock_counters([test_item], "test_key")
+    status = "✅" if touched == {} else "❌"
+    print(f"   {status} Touched on first sighting: {touched}")
     
     # 2. Sale: stock=90
     print("2. Sale: 100 -> 90...")
     monitor.previous_state = {key: {'real_stock': 100}}
     test_item['real_stock'] = 90
-    monitor._update_stock_counters([test_item], "test_key")
-    diffs = monitor.stock_cumulative_diffs["test_key"][key]
+    diffs = monitor._update_stock_counters([test_item], "test_key")[key]
     print(f"   Real stock: 90, Diffs: {diffs}")
     
     # 3. Return: stock=95 (<= threshold)
     print("3. Return: 90 -> 95...")
     monitor.previous_state = {key: {'real_stock': 90}}
     test_item['real_stock'] = 95
-    monitor._update_stock_counters([test_item], "test_key")
-    diffs = monitor.stock_cumulative_diffs["test_key"][key]
+    diffs = monitor._update_stock_counters([test_item], "test_key")[key]
     print(f"   Real stock: 95, Diffs: {diffs}")
     
     # 4. Restock: stock=2095 (> threshold)
     print("4. Restock: 95 -> 2095...")
     monitor.previous_state = {key: {'real_stock': 95}}
     test_item['real_stock'] = 2095
-    monitor._update_stock_counters([test_item], "test_key")
-    diffs = monitor.stock_cumulative_diffs["test_key"][key]
+    diffs = monitor._update_stock_counters([test_item], "test_key")[key]
     print(f"   Real stock: 2095, Diffs: {diffs}")
     
     # 5. Format check (with diffs)
-    display_with_diffs = monitor._format_stock_display(test_item, show_diffs=True, msg_key="test_key")
+    display_with_diffs = monitor.telegram._format_stock_display(test_item, show_diffs=True, msg_key="test_key",
+                                                                stock_cumulative_diffs=monitor.stock_cumulative_diffs)
     print(f"   With diffs: {display_with_diffs}")
     
     # 6. Format check (without diffs - Full Report mode)
-    display_clean = monitor._format_stock_display(test_item, show_diffs=False)
+    display_clean = monitor.telegram._format_stock_display(test_item, show_diffs=False)
     print(f"   Clean (Full Report): {display_clean}")
     
     expected_diffs = {'decrease': -5, 'increase': 2000}
@@ -149,14 +203,14 @@ def run_tests():
     changes = {'current': [{'name': 'Item 1', 'link': 'url1', 'capacity': 100, 'price': '10', 'stock_status': 'in_stock', 'real_stock': 50}]}
     
     # Default header
-    msg_default = monitor.format_telegram_message(changes, include_unchanged=True)
+    msg_default = monitor.telegram.format_telegram_message(changes, include_unchanged=True)
     if "📋 *Без змін (1):*" in msg_default:
         print("✅ Default Header: OK")
     else:
         print(f"❌ Default Header: FAILED. Got: {msg_default}")
         
     # Custom header "Новий стан"
-    msg_custom = monitor.format_telegram_message(changes, include_unchanged=True, unchanged_header="Новий стан")
+    msg_custom = monitor.telegram.format_telegram_message(changes, include_unchanged=True, unchanged_header="Новий стан")
     if "📋 *Новий стан (1):*" in msg_custom:
         print("✅ Custom Header: OK")
     else:
@@ -174,84 +228,61 @@ def run_tests():
 
     # Test 7: Smart Heartbeat Logic (_should_notify)
     print('\n--- TEST 7: Smart Heartbeat Logic (_should_notify) ---')
-    from datetime import datetime, time as dt_time, timedelta
-    
-    monitor.config['heartbeat_times'] = [dt_time(8, 0), dt_time(16, 0)]
-    monitor.config['heartbeat_cooldown'] = monitor._calculate_auto_cooldown(monitor.config['heartbeat_times'])
+    # The notifier derives the heartbeat interval from the schedule: [8:00, 16:00] -> 8h
+    notifier = TelegramNotifier({'parse_mode': 'Markdown', 'heartbeat_times': [T_0800, T_1600]})
+    recipient = {'quiet_mode': True}
     
     # Використовуємо фіксовану дату як базу для тестів, щоб не залежати від реального "зараз"
-    base_date = datetime(2025, 1, 1, 12, 0)
+    base_date = BASE_DATE
     
     # Case A: Changes detected
-    res, reason = monitor._should_notify(has_changes=True)
+    res, reason = notifier._should_notify(recipient, True, base_date)
     status = "✅" if (res, reason) == (True, "changes") else "❌"
     print(f'{status} Case A (Changes): {res}, reason: {reason}')
 
-    # Case B: Cooldown active (last notification 2h ago relative to now)
-    now_real = datetime.now()
-    monitor.last_notification_time = now_real - timedelta(hours=2)
-    res, reason = monitor._should_notify(has_changes=False)
-    status = "✅" if (res, reason) == (False, "cooldown") else "❌"
-    print(f'{status} Case B (Cooldown): {res}, reason: {reason}')
-
-    # Case C: Heartbeat time reached (now >= 8:00, last yesterday - sufficiency far for cooldown)
-    # last = 20:00 day before base_date
-    monitor.last_notification_time = base_date - timedelta(days=1)
-    # mock_now = 8:05 AM on base_date
-    mock_now = datetime.combine(base_date.date(), dt_time(8, 5))
-    import unittest.mock
-    with unittest.mock.patch('nkon_monitor.datetime') as mock_datetime:
-        mock_datetime.now.return_value = mock_now
-        mock_datetime.fromisoformat = datetime.fromisoformat
-        mock_datetime.combine = datetime.combine
-        res, reason = monitor._should_notify(has_changes=False)
+    # Cases B-F share one patched clock; each case only moves clock.now
+    with _mock_datetime(base_date) as clock:
+        # Case B: Cooldown active (last notification 2h ago relative to now)
+        last = base_date - timedelta(hours=2)
+        res, reason = notifier._should_notify(recipient, False, last)
+        status = "✅" if (res, reason) == (False, "cooldown") else "❌"
+        print(f'{status} Case B (Cooldown): {res}, reason: {reason}')
+
+        # Case C: Heartbeat time reached (now 8:05, last a day before base_date - far beyond the cooldown)
+        last = base_date - timedelta(days=1)
+        clock.now = DT_0805
+        res, reason = notifier._should_notify(recipient, False, last)
         status = "✅" if (res, reason) == (True, "heartbeat") else "❌"
         print(f'{status} Case C (Heartbeat 8:00): {res}, reason: {reason}')
 
-    # Case D: Before heartbeat time (now = 7:30)
-    mock_now = datetime.combine(base_date.date(), dt_time(7, 30))
-    with unittest.mock.patch('nkon_monitor.datetime') as mock_datetime:
-        mock_datetime.now.return_value = mock_now
-        mock_datetime.fromisoformat = datetime.fromisoformat
-        mock_datetime.combine = datetime.combine
-        res, reason = monitor._should_notify(has_changes=False)
-        status = "✅" if (res, reason) == (False, "silent") else "❌"
-        print(f'{status} Case D (Before Heartbeat): {res}, reason: {reason}')
-
-    # Case E: First slot passed, second slot reached (now 16:30, last was at 8:05)
-    # З автоматичним кулдауном для [8:00, 16:00] він буде 8 годин.
-    # 16:30 - 8:05 = ~8.4 год. Це > 8 год, тому має спрацювати HEARTBEAT!
-    monitor.last_notification_time = datetime.combine(base_date.date(), dt_time(8, 5))
-    mock_now = datetime.combine(base_date.date(), dt_time(16, 30))
-    with unittest.mock.patch('nkon_monitor.datetime') as mock_datetime:
-        mock_datetime.now.return_value = mock_now
-        mock_datetime.fromisoformat = datetime.fromisoformat
-        mock_datetime.combine = datetime.combine
-        res, reason = monitor._should_notify(has_changes=False)
+        # Case D: The decision is interval-based, so 7:30 with the same last (19.5h ago) is a heartbeat too
+        clock.now = DT_0730
+        res, reason = notifier._should_notify(recipient, False, last)
+        status = "✅" if (res, reason) == (True, "heartbeat") else "❌"
+        print(f'{status} Case D (Before 8:00, interval passed): {res}, reason: {reason}')
+
+        # Case E: First slot passed, second slot reached (now 16:30, last was at 8:05)
+        # З автоматичним кулдауном для [8:00, 16:00] він буде 8 годин.
+        # 16:30 - 8:05 = ~8.4 год. Це > 8 год, тому має спрацювати HEARTBEAT!
+        clock.now = DT_1630
+        res, reason = notifier._should_notify(recipient, False, DT_0805)
         status = "✅" if (res, reason) == (True, "heartbeat") else "❌"
         print(f'{status} Case E (Heartbeat 16:00, auto-cooldown): {res}, reason: {reason}')
-    
-    # Case F: All slots today already handled (now 20:00, last was 16:10)
-    monitor.last_notification_time = datetime.combine(base_date.date(), dt_time(16, 10))
-    mock_now = datetime.combine(base_date.date(), dt_time(20, 0))
-    with unittest.mock.patch('nkon_monitor.datetime') as mock_datetime:
-        mock_datetime.now.return_value = mock_now
-        mock_datetime.fromisoformat = datetime.fromisoformat
-        mock_datetime.combine = datetime.combine
-        res, reason = monitor._should_notify(has_changes=False)
+
+        # Case F: All slots today already handled (now 20:00, last was 16:10)
+        clock.now = DT_2000
+        res, reason = notifier._should_notify(recipient, False, DT_1610)
         status = "✅" if (res, reason) == (False, "cooldown") else "❌"
         print(f'{status} Case F (After all heartbeats, cooldown active): {res}, reason: {reason}')
 
+        # Case G: Quiet mode off - every run reports
+        res, reason = notifier._should_notify({}, False, DT_1610)
+        status = "✅" if (res, reason) == (True, "no_quiet") else "❌"
+        print(f'{status} Case G (Quiet mode off): {res}, reason: {reason}')
+
     # Test 8: Automatic Cooldown Calculation
     print('\n--- TEST 8: Automatic Cooldown Calculation ---')
-    test_cases = [
-        ([dt_time(8, 0)], 24.0),
-        ([dt_time(8, 0), dt_time(20, 0)], 12.0),
-        ([dt_time(8, 0), dt_time(12, 0), dt_time(16, 0)], 4.0),
-        ([dt_time(7, 0), dt_time(12, 0), dt_time(18, 0)], 5.0), # 7-12=5, 12-18=6, 18-7=13
-    ]
-    
-    for times, expected in test_cases:
+    for times, expected in AUTO_COOLDOWN_CASES:
         res = monitor._calculate_auto_cooldown(times)
         status = "✅" if res == expected else "❌"
         print(f'{status} {times} -> {res} (expected {expected})')
@@ -284,14 +315,13 @@ def run_tests():
 
     # Test 13: Night Mode Logic
     print('\n--- TEST 13: Night Mode Logic ---')
-    m = MockMonitor()
+    monitor.reset()
+    m = monitor
     m.config['telegram_bot_token'] = 'token'
     m.config['recipients'] = [{'chat_id': '123', 'quiet_night_mode': True}]
     
     # 22:00 (Night)
-    with unittest.mock.patch('nkon_monitor.datetime') as mock_dt:
-        from datetime import datetime
-        mock_dt.now.return_value = datetime(2025, 1, 1, 22, 0)
+    with _mock_datetime(datetime(2025, 1, 1, 22, 0)):
         res = m.send_telegram_message("night test")
         # In MockMonitor we return {"123": 456}, but we need to verify if disable_notification was applied.
         # However, MockMonitor's send_telegram_message is simple.
@@ -306,12 +336,13 @@ def run_tests():
     night_dt = datetime(2025, 1, 1, 22, 0)
     day_dt = datetime(2025, 1, 1, 14, 0)
     
-    m_real = MockMonitor()
+    m.reset()
+    m_real = m
     m_real.config['recipients'] = [{'chat_id': '123', 'quiet_night_mode': True}]
     
     # Simulate send_telegram_message night check
-    is_night = night_dt.hour >= 21 or night_dt.hour < 8
-    is_day = day_dt.hour >= 21 or day_dt.hour < 8
+    is_night = _in_quiet_window(night_dt.hour, 21, 8)
+    is_day = _in_quiet_window(day_dt.hour, 21, 8)
     
     status_night = "✅" if is_night else "❌"
     status_day = "✅" if not is_day else "❌"
@@ -325,8 +356,8 @@ def run_tests():
     preorder_items = [{'stock_status': 'preorder', 'link': 'url2', 'capacity': 280}]
     
     # We verify the logic used in nkon_monitor.py (line 1195 roughly)
-    should_fetch_in_stock = all(p['stock_status'] == 'preorder' for p in in_stock_items)
-    should_fetch_preorder = all(p['stock_status'] == 'preorder' for p in preorder_items)
+    should_fetch_in_stock = {p['stock_status'] for p in in_stock_items} == {'preorder'}
+    should_fetch_preorder = {p['stock_status'] for p in preorder_items} == {'preorder'}
     
     res_in_stock = not should_fetch_in_stock
     res_preorder = should_fetch_preorder
@@ -357,8 +388,8 @@ def run_tests():
         'name': 'Eve LF280'
     }
     
-    res_in_stock = monitor._format_stock_display(in_stock_item)
-    res_preorder = monitor._format_stock_display(preorder_item)
+    res_in_stock = monitor.telegram._format_stock_display(in_stock_item)
+    res_preorder = monitor.telegram._format_stock_display(preorder_item)
     
     print(f'In stock (real_stock=None): "{res_in_stock}"')
     print(f'Preorder (real_stock=None): "{res_preorder}"')
@@ -370,11 +401,7 @@ def run_tests():
 
     # Test 16: Footer Multi-link (from .env)
     print('\n--- TEST 16: Footer Multi-link (from .env) ---')
-    import settings
-    all_footer_links = [
-        {'url': r['url'], 'name': r.get('name', 'Чат')}
-        for r in settings.RECIPIENTS[1:] if r.get('url')
-    ]
+    all_footer_links = settings.FOOTER_LINKS
     
     print(f"   Found {len(all_footer_links)} footer links in settings.")
     for link in all_footer_links:
@@ -383,9 +410,9 @@ def run_tests():
     changes = {'current': [{'name': 'Test Item', 'link': 'url1', 'capacity': 280, 'price': '50', 'stock_status': 'in_stock', 'real_stock': 10}]}
     
     # Test for Main Channel (footer should be present)
-    msg_main = monitor.format_telegram_message(changes, include_unchanged=True, footer_links=all_footer_links)
+    msg_main = monitor.telegram.format_telegram_message(changes, include_unchanged=True, footer_links=all_footer_links)
     # Test for Group (footer should be absent)
-    msg_group = monitor.format_telegram_message(changes, include_unchanged=True, footer_links=None)
+    msg_group = monitor.telegram.format_telegram_message(changes, include_unchanged=True, footer_links=None)
     
     print("\n   --- Preview (Main Channel) ---")
     print(msg_main)
@@ -410,7 +437,7 @@ def run_tests():
     
     passed_17 = True
     for test_text, expected in grade_cases:
-        res = monitor._extract_grade(test_text)
+        res = extract_grade(test_text)
         status = "✅" if res == expected else "❌"
         if res != expected: passed_17 = False
         print(f'{status} "{test_text}" -> {res} (expected {expected})')
@@ -421,4 +448,11 @@ def run_tests():
         print("❌ TEST 17 FAILED")
 
 if __name__ == "__main__":
-    run_tests()
+    # Collect the report in memory and write it in one go (also when a test raises)
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf):
+            run_tests()
+    finally:
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
@@ -5,7 +5,43 @@ Utility functions for NKON Monitor
 """
 
 import re
+import hashlib
+from functools import lru_cache
 
+# Регулярні вирази компілюються один раз при імпорті модуля.
+# Цифри задаються як [0-9]: сайт віддає лише ASCII-цифри, а \s лишається юнікодним (nbsp)
+_CAPACITY_RE = re.compile(r'([0-9]{3,})\s*(?:Ah|ah|AH|aH|Аг|аг|АГ|аГ)')
+_GRADE_PATTERN = r'(?:(?:Grade|Клас|Група)\s*[A-BА-Б][-+]?|[A-BА-Б]-Grade)'
+# Той самий грейд з іменованими групами: літера та суфікс -/+ (для extract_grade)
+_GRADE_RE = re.compile(
+    r'(?:(?:Grade|Клас|Група)\s*(?P<letter>[A-BА-Б])(?P<suffix>[-+]?)|(?P<prefix>[A-BА-Б])-Grade)',
+    re.IGNORECASE
+)
+# Латинські та кириличні літери грейду в будь-якому регістрі -> A/B
+_GRADE_LETTERS = {'A': 'A', 'a': 'A', 'А': 'A', 'а': 'A', 'B': 'B', 'b': 'B', 'Б': 'B', 'б': 'B'}
+# Все, що прибирає shorten_name, за один прохід: грейд (показується окремо)
+# та технічні характеристики (зрозумілі з контексту)
+_SHORTEN_RE = re.compile('|'.join((
+    _GRADE_PATTERN,
+    r'LiFePO4', r'3\.2V', r'Prismatic', r'Rechargeable',
+    r'Battery', r'Cell', r'[0-9]+\s*(?:Ah|ah|AH|aH|Аг|аг|АГ|аГ)',  # Ємність вже є на початку
+    r'Призматичний'  # Українська "Prismatic"
+)), re.IGNORECASE)
+_DIGITS = frozenset('0123456789')
+# День/місяць з 1-2 цифр -> рядок з ведучим нулем ('3' -> '03', '07' -> '07')
+_PAD2 = {f"{i}": f"{i:02d}" for i in range(10)}
+_PAD2.update({f"{i:02d}": f"{i:02d}" for i in range(100)})
+
+class _PriceCharsTable(dict):
+    """Таблиця для str.translate: цифри та крапка лишаються, решта символів видаляється.
+    Невідомі символи (€, пробіли, літери) запам'ятовуються при першій зустрічі."""
+    def __missing__(self, key):
+        self[key] = None
+        return None
+
+_PRICE_CHARS = _PriceCharsTable((ord(c), ord(c)) for c in '0123456789.')
+
+@lru_cache(maxsize=1024)
 def clean_price(price_text: str) -> float:
     """
     Очищення та конвертація ціни в float
@@ -20,13 +56,14 @@ def clean_price(price_text: str) -> float:
         return None
         
     # Видалення символу євро та інших нецифрових символів, крім крапки
-    cleaned = re.sub(r'[^\d.]', '', price_text.replace(',', '.'))
+    cleaned = price_text.replace(',', '.').translate(_PRICE_CHARS)
     
     try:
         return float(cleaned)
     except ValueError:
         return None
 
+@lru_cache(maxsize=1024)
 def extract_capacity(text: str) -> int:
     """
     Витягування ємності батареї з тексту
@@ -41,7 +78,7 @@ def extract_capacity(text: str) -> int:
         return None
         
         # Пошук чисел перед Ah або Аг (кирилиця)
-    match = re.search(r'(\d{3,})\s*(?:Ah|ah|AH|aH|Аг|аг|АГ|аГ)', text)
+    match = _CAPACITY_RE.search(text)
     if match:
         try:
             return int(match.group(1))
@@ -49,44 +86,28 @@ def extract_capacity(text: str) -> int:
             return None
     return None
 
+@lru_cache(maxsize=1024)
 def extract_grade(text: str) -> str:
     """
     Витягування грейду (Grade A/B) з назви
     Підтримує англійську (Grade) та українську (Клас) версії
     """
     # Grade A, Grade A-, Клас A, Група A, B-Grade тощо
-    match = re.search(r'(?i)(?:(?:Grade|Клас|Група)\s*[A-BА-Б][-+]?|[A-BА-Б]-Grade)', text)
-    if match:
-        grade = match.group(0)
-        # Нормалізація: B-Grade -> Grade B
-        if len(grade) > 1 and grade[1] == '-': 
-            return f"Grade {grade[0]}"
-        # Клас A -> Grade A, Група A -> Grade A
-        grade = re.sub(r'(?i)(Клас|Група)', 'Grade', grade)
-        # Нормалізація літер (Кирилиця А/Б -> Латиниця A/B)
-        grade = grade.replace('А', 'A').replace('Б', 'B')
-        grade = grade.title()  # grade a -> Grade A
-        return grade
-    return "?"
+    match = _GRADE_RE.search(text)
+    if not match:
+        return "?"
+    # B-Grade -> Grade B; Клас A / Група А / grade a- -> Grade A / Grade A-
+    letter = match.group('letter') or match.group('prefix')
+    return f"Grade {_GRADE_LETTERS[letter]}{match.group('suffix') or ''}"
 
+@lru_cache(maxsize=1024)
 def shorten_name(text: str) -> str:
     """
     Скорочення назви товару для компактності
     Підтримує англійську та українську версії
     """
-    # 1. Видаляємо грейд (бо ми його показуємо окремо)
-    # Підтримка Grade/Клас/Група
-    text = re.sub(r'(?i)(?:(?:Grade|Клас|Група)\s*[A-BА-Б][-+]?|[A-BА-Б]-Grade)', '', text)
-    
-    # 2. Видаляємо технічні характеристики (бо вони зрозумілі з контексту)
-    remove_words = [
-        r'LiFePO4', r'3\.2V', r'Prismatic', r'Rechargeable', 
-        r'Battery', r'Cell', r'\d+\s*(?:Ah|ah|AH|aH|Аг|аг|АГ|аГ)',  # Ємність вже є на початку
-        r'Призматичний'  # Українська "Prismatic"
-    ]
-    
-    for word in remove_words:
-        text = re.sub(f'(?i){word}', '', text)
+    # 1-2. Видаляємо грейд (Grade/Клас/Група) та технічні характеристики
+    text = _SHORTEN_RE.sub('', text)
         
     # 3. Видаляємо зайві символи та пробіли
     text = text.replace(' - ', ' ').replace(' , ', ' ')
@@ -103,6 +124,44 @@ def shorten_name(text: str) -> str:
         
     return text.strip()
 
+def _is_digits(text: str, start: int, end: int) -> bool:
+    part = text[start:end]
+    return len(part) == end - start and all(c in _DIGITS for c in part)
+
+def parse_delivery_date(text: str) -> str:
+    """
+    Пошук дати доставки у форматі DD-MM-YYYY (день і місяць можуть бути без нуля)
+    
+    Простий сканер по дефісах замість regex; результат збігається з першим зліва
+    входженням 1-2 цифр, дефіса, 1-2 цифр, дефіса та 4 цифр.
+    
+    Returns:
+        Нормалізована дата 'DD-MM-YYYY' або None
+    """
+    if not text:
+        return None
+    
+    h = text.find('-')
+    while h != -1:
+        # День: 2 цифри перед дефісом, інакше 1
+        for start in (h - 2, h - 1):
+            if start < 0 or not _is_digits(text, start, h):
+                continue
+            # Місяць: 2 цифри, інакше 1; далі дефіс і рік з 4 цифр
+            for m_end in (h + 3, h + 2):
+                if text[m_end:m_end + 1] == '-' and _is_digits(text, h + 1, m_end) and _is_digits(text, m_end + 1, m_end + 5):
+                    return f"{_PAD2[text[start:h]]}-{_PAD2[text[h + 1:m_end]]}-{text[m_end + 1:m_end + 5]}"
+        h = text.find('-', h + 1)
+    return None
+
+@lru_cache(maxsize=8192)
+def graph_id(product_key: str) -> str:
+    """
+    Ідентифікатор графіка товару (файл graph_<id>.html) за ключем "<посилання>_<ємність>".
+    Спільний для посилань у повідомленнях та імен файлів графіків.
+    """
+    return hashlib.md5(product_key.encode()).hexdigest()[:8]
+
 def mask_sensitive(text: str) -> str:
     """Маскування чутливих даних в логах"""
     if not text: return ""
@@ -11,6 +11,35 @@ import sys
 import argparse
 from typing import Dict, List, Any, Optional
 
+# Optional: faster JSON round-trip of TELEGRAM_CONFIG_JSON (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Unquoted JS-style keys in TELEGRAM_CONFIG_JSON (name: -> "name":)
+_UNQUOTED_KEY_RE = re.compile(r'([{,]\s*)([a-zA-Z_][a-zA-Z0-9_]*)(\s*):')
+# TELEGRAM_CONFIG_JSON= followed by quoted (possibly multiline) or unquoted value
+_CONFIG_JSON_RE = re.compile(
+    r"TELEGRAM_CONFIG_JSON\s*=\s*(?:"
+    r"'[^']*(?:'|$)"
+    r'|"[^"]*(?:"|$)'
+    r"|[^\n]*)",
+    re.DOTALL
+)
+
+def _json_loads(raw: str) -> Any:
+    # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def _json_dumps(data: Any, pretty: bool = False) -> str:
+    """Compact (or 2-space indented) JSON with non-ASCII characters kept as is."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0).decode('utf-8')
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
 def mask_token(token: str) -> str:
     if len(token) > 8:
         return f"{token[:4]}***{token[-4:]}"
@@ -30,43 +59,38 @@ def parse_env_manually(filepath: str) -> Dict[str, str]:
     except ImportError:
         pass
 
-    # Fallback: stateful line-based parser
+    # Fallback: stateful line-based parser (reads the file as a stream)
     with open(filepath, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        i += 1
-        if not line or line.startswith('#'):
-            continue
-        if '=' not in line:
-            continue
-
-        key, _, val = line.partition('=')
-        key = key.strip()
-
-        # Check for quoted multiline values
-        if val.startswith("'") or val.startswith('"'):
-            quote = val[0]
-            if val.endswith(quote) and len(val) > 1:
-                # Single-line quoted value
-                env_vars[key] = val[1:-1]
+        for raw_line in f:
+            line = raw_line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if '=' not in line:
+                continue
+
+            key, _, val = line.partition('=')
+            key = key.strip()
+
+            # Check for quoted multiline values
+            if val.startswith("'") or val.startswith('"'):
+                quote = val[0]
+                if val.endswith(quote) and len(val) > 1:
+                    # Single-line quoted value
+                    env_vars[key] = val[1:-1]
+                else:
+                    # Multiline: consume lines from the same iterator until closing quote
+                    parts = [val[1:]]  # strip opening quote
+                    for next_line in f:
+                        next_line = next_line.rstrip('\n').rstrip('\r')
+                        if next_line.rstrip().endswith(quote):
+                            parts.append(next_line.rstrip()[:-1])  # strip closing quote
+                            break
+                        parts.append(next_line)
+                    env_vars[key] = '\n'.join(parts)
             else:
-                # Multiline: collect until closing quote
-                parts = [val[1:]]  # strip opening quote
-                while i < len(lines):
-                    next_line = lines[i].rstrip('\n').rstrip('\r')
-                    i += 1
-                    if next_line.rstrip().endswith(quote):
-                        parts.append(next_line.rstrip()[:-1])  # strip closing quote
-                        break
-                    parts.append(next_line)
-                env_vars[key] = '\n'.join(parts)
-        else:
-            # Unquoted value (strip inline comments)
-            val = val.split('#')[0].strip()
-            env_vars[key] = val
+                # Unquoted value (strip inline comments)
+                val = val.split('#')[0].strip()
+                env_vars[key] = val
 
     return env_vars
 
@@ -75,7 +99,7 @@ def fix_json_syntax(raw_json: str) -> str:
     # Fix unquoted keys like name: or chat_id:
     # This regex looks for word characters followed by a colon that are NOT already in quotes
     # It's a heuristic but works for our expected structure
-    fixed = re.sub(r'([{,]\s*)([a-zA-Z_][a-zA-Z0-9_]*)(\s*):', r'\1"\2"\3:', raw_json)
+    fixed = _UNQUOTED_KEY_RE.sub(r'\1"\2"\3:', raw_json)
     return fixed
 
 def verify(filepath: str, fix: bool = False, beautify: bool = False):
@@ -105,7 +129,7 @@ def verify(filepath: str, fix: bool = False, beautify: bool = False):
     config_data = []
     
     try:
-        config_data = json.loads(raw_config)
+        config_data = _json_loads(raw_config)
         is_valid_json = True
         print("✅ TELEGRAM_CONFIG_JSON: valid JSON")
     except json.JSONDecodeError as e:
@@ -115,7 +139,7 @@ def verify(filepath: str, fix: bool = False, beautify: bool = False):
         # Try to fix it
         fixed_json = fix_json_syntax(raw_config)
         try:
-            config_data = json.loads(fixed_json)
+            config_data = _json_loads(fixed_json)
             print("   💡 Підказка: Знайдено помилки синтаксису (наприклад, пропущені лапки).")
             if fix:
                 is_valid_json = True
@@ -159,29 +183,18 @@ def verify(filepath: str, fix: bool = False, beautify: bool = False):
     if fix or beautify:
         if is_valid_json:
             # Reconstruct the string
-            if beautify:
-                new_config_val = json.dumps(config_data, indent=2, ensure_ascii=False)
-            else:
-                new_config_val = json.dumps(config_data, separators=(',', ':'), ensure_ascii=False)
+            new_config_val = _json_dumps(config_data, pretty=beautify)
 
             # Read entire file content
             with open(filepath, 'r', encoding='utf-8') as f:
                 content = f.read()
 
             # Replace TELEGRAM_CONFIG_JSON value (handles both single-line and multiline)
-            # Pattern: TELEGRAM_CONFIG_JSON= followed by quoted or unquoted value
-            pattern = re.compile(
-                r"TELEGRAM_CONFIG_JSON\s*=\s*(?:"
-                r"'[^']*(?:'|$)"
-                r'|"[^"]*(?:"|$)'
-                r"|[^\n]*)",
-                re.DOTALL
-            )
-
             replacement = f"TELEGRAM_CONFIG_JSON='{new_config_val}'"
 
-            if pattern.search(content):
-                new_content = pattern.sub(replacement, content, count=1)
+            if _CONFIG_JSON_RE.search(content):
+                # Function replacement: backslashes in the JSON must not be treated as regex escapes
+                new_content = _CONFIG_JSON_RE.sub(lambda _: replacement, content, count=1)
             else:
                 new_content = content.rstrip() + f"\n{replacement}\n"
 
@@ -1,16 +1,51 @@
 import sqlite3
+import gzip
 import json
+import io
 import logging
 import os
-import hashlib
+import queue
+import re
 import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import chain
+from html import escape
+from pathlib import Path
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import settings
 from db_manager import HistoryDB
 
+# Optional: faster serialization of chart data (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Налаштування з'єднання для читання історії: mmap замість read(), кеш сторінок 64 МБ, тимчасові дані в пам'яті
+_READ_PRAGMAS = (
+    "PRAGMA query_only = 1",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+# Скрипти Chart.js: {плейсхолдер: (локальне ім'я файлу, адреса на CDN)}.
+# З GRAPHS_LOCAL_ASSETS копії завантажуються один раз і лежать на сервері поруч із графіками
+_CHART_ASSETS = {
+    'chart_js_src': ('chart.js', 'https://cdn.jsdelivr.net/npm/chart.js'),
+    'chart_adapter_src': ('chartjs-adapter-date-fns.js', 'https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns'),
+}
+
+# Паралельні SFTP-канали для вивантаження графіків та таймаут операцій на каналі (с)
+SFTP_UPLOAD_WORKERS = 4
+SFTP_TIMEOUT = 30
+# Скільки готових сторінок може чекати на вивантаження, поки генеруються наступні
+SFTP_QUEUE_SIZE = 16
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -20,9 +55,11 @@ HTML_TEMPLATE = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>NKON History - {product_name}</title>
+    <link rel="preconnect" href="https://fonts.googleapis.com">
+    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;800&display=swap" rel="stylesheet">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns"></script>
+    <script src="{chart_js_src}"></script>
+    <script src="{chart_adapter_src}"></script>
     <style>
         body {
             font-family: 'Inter', sans-serif;
@@ -139,16 +176,20 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 
     <script>
         const dashboardData = {__DATA__};
+        // Columnar history: parallel arrays of timestamps (x) and values
+        const priceData = dashboardData.price_history;
+        const stockData = dashboardData.stock_history;
+        const toPoints = (xs, ys) => xs.map((x, i) => ({x: x, y: ys[i]}));
         
         // Update stats
-        if(dashboardData.price_history.length > 0) {
-            const lastPrice = dashboardData.price_history[dashboardData.price_history.length-1].y;
+        if(priceData.x.length > 0) {
+            const lastPrice = priceData.y[priceData.y.length-1];
             document.getElementById('current-price').innerText = '€' + lastPrice.toFixed(2);
         }
-        if(dashboardData.stock_history.length > 0) {
-            const lastStock = dashboardData.stock_history[dashboardData.stock_history.length-1];
-            document.getElementById('current-stock').innerText = lastStock.in_stock;
-            document.getElementById('current-preorder').innerText = lastStock.preorder;
+        if(stockData.x.length > 0) {
+            const last = stockData.x.length-1;
+            document.getElementById('current-stock').innerText = stockData.in_stock[last];
+            document.getElementById('current-preorder').innerText = stockData.preorder[last];
         }
 
         // Common Chart Defaults
@@ -163,7 +204,7 @@ HTML_TEMPLATE = """<!DOCTYPE html>
                 datasets: [
                     {
                         label: 'В наявності',
-                        data: dashboardData.stock_history.map(d => ({x: d.x, y: d.in_stock})),
+                        data: toPoints(stockData.x, stockData.in_stock),
                         borderColor: '#10b981',
                         backgroundColor: 'rgba(16, 185, 129, 0.2)',
                         fill: true,
@@ -174,7 +215,7 @@ HTML_TEMPLATE = """<!DOCTYPE html>
                     },
                     {
                         label: 'Передзамовлення',
-                        data: dashboardData.stock_history.map(d => ({x: d.x, y: d.preorder})),
+                        data: toPoints(stockData.x, stockData.preorder),
                         borderColor: '#f59e0b',
                         backgroundColor: 'rgba(245, 158, 11, 0.2)',
                         fill: true,
@@ -224,7 +265,7 @@ HTML_TEMPLATE = """<!DOCTYPE html>
             data: {
                 datasets: [{
                     label: 'Ціна (€)',
-                    data: dashboardData.price_history,
+                    data: toPoints(priceData.x, priceData.y),
                     borderColor: '#3b82f6',
                     backgroundColor: 'rgba(59, 130, 246, 0.1)',
                     fill: true,
@@ -278,6 +319,22 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 </html>
 """
 
+# HTML_TEMPLATE, розбитий один раз: парні елементи — текст, непарні — імена плейсхолдерів
+_TEMPLATE_PARTS = re.split(r'\{(product_name|product_url|last_updated|chart_js_src|chart_adapter_src|__DATA__)\}', HTML_TEMPLATE)
+_TEMPLATE_KEYS = _TEMPLATE_PARTS[1::2]
+
+def _render_template(values: dict) -> str:
+    """Підставляє значення в HTML_TEMPLATE за один прохід (замість ланцюжка str.replace)"""
+    parts = _TEMPLATE_PARTS.copy()
+    parts[1::2] = [values[key] for key in _TEMPLATE_KEYS]
+    return ''.join(parts)
+
+def _chart_json(data) -> str:
+    """Компактний JSON даних графіка (orjson, якщо встановлено)"""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'))
+
 class HistoryVisualizer:
     def __init__(self, db_path="nkon_history.db"):
         self.db_path = db_path
@@ -285,8 +342,13 @@ class HistoryVisualizer:
         self.ftp_user = settings.FTP_USER
         self.ftp_pass = settings.FTP_PASS
         self.ftp_dir = settings.FTP_DIR
+        self.gzip_pages = settings.GRAPHS_GZIP
+        self._conn = None # З'єднання лише для читання, відкривається при першій вибірці
+        self.local_assets = settings.GRAPHS_LOCAL_ASSETS
+        self._asset_files = None # [(локальний шлях, ім'я на сервері)] скриптів Chart.js
         self.output_dir = "html_output"
         os.makedirs(self.output_dir, exist_ok=True)
+        self._pending_cache = {} # {product_id: запис graph_cache}; зберігається після успішного вивантаження
 
     def _inject_statcounter(self, html_content: str) -> str:
         """
@@ -321,55 +383,110 @@ alt="Web Analytics" referrerPolicy="no-referrer-when-downgrade"></a></div></nosc
             return html_content.replace("</body>", statcounter_snippet, 1)
         return html_content
 
+    def _asset_sources(self) -> dict:
+        """Адреси скриптів Chart.js для сторінок: локальні копії (завантажуються з CDN один раз) або CDN"""
+        cdn_sources = {key: url for key, (_, url) in _CHART_ASSETS.items()}
+        if not self.local_assets:
+            return cdn_sources
+        if self._asset_files is None:
+            self._asset_files = []
+            try:
+                for file_name, url in _CHART_ASSETS.values():
+                    path = os.path.join(self.output_dir, file_name)
+                    if not os.path.exists(path):
+                        response = requests.get(url, timeout=30)
+                        response.raise_for_status()
+                        with open(path + '.tmp', 'wb') as f:
+                            f.write(response.content)
+                        os.replace(path + '.tmp', path)
+                    self._asset_files.append((path, file_name))
+            except Exception as e:
+                logger.warning(f"Не вдалося завантажити скрипти Chart.js, сторінки використовуватимуть CDN: {e}")
+                self._asset_files = []
+        if not self._asset_files:
+            return cdn_sources
+        return {key: file_name for key, (file_name, _) in _CHART_ASSETS.items()}
+
+    def _connect_readonly(self) -> sqlite3.Connection:
+        """З'єднання з БД історії лише для читання; відкривається один раз на екземпляр і перевикористовується"""
+        if self._conn is None:
+            # HistoryDB доводить схему до актуальної (колонка graph_id, індекси, WAL)
+            HistoryDB(self.db_path).close()
+            conn = sqlite3.connect(Path(self.db_path).resolve().as_uri() + "?mode=ro", uri=True)
+            for pragma in _READ_PRAGMAS:
+                conn.execute(pragma)
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Закриття з'єднання з БД історії"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
     def extract_data(self, product_ids=None):
         """Витягує дані з бази та форматує для Chart.js. Якщо product_ids задано, бере тільки їх."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        cursor = self._connect_readonly().cursor()
 
         # Get products
         if product_ids:
             placeholders = ','.join(['?'] * len(product_ids))
-            cursor.execute(f"SELECT id, product_key, name, url FROM products WHERE id IN ({placeholders})", product_ids)
+            cursor.execute(f"SELECT id, graph_id, name, url FROM products WHERE id IN ({placeholders})", product_ids)
         else:
-            cursor.execute("SELECT id, product_key, name, url FROM products")
+            cursor.execute("SELECT id, graph_id, name, url FROM products")
         
         products = cursor.fetchall()
 
+        # Історія цін і залишків двома запитами на всі товари (замість 2 запитів на кожен товар)
+        if product_ids:
+            history_filter = f"WHERE product_id IN ({placeholders}) "
+            history_params = product_ids
+        else:
+            history_filter, history_params = "", ()
+
+        # Рядки відсортовані за product_id: читаємо курсор потоково і дописуємо в списки поточного товару.
+        # Історія зберігається по колонках (паралельні списки) — без dict на кожен рядок
+        price_by_product = {}
+        last_id = None
+        for p_id, ts, price in cursor.execute(f"SELECT product_id, timestamp, price FROM price_history {history_filter}ORDER BY product_id, timestamp ASC", history_params):
+            if p_id != last_id:
+                last_id = p_id
+                xs, prices = [], []
+                price_by_product[p_id] = {"x": xs, "y": prices}
+            # Chart.js time adapter expects ISO or valid JS dates
+            xs.append(ts.replace(' ', 'T'))
+            prices.append(price)
+
+        stock_by_product = {}
+        last_id = None
+        # NULL -> 0 рахує SQLite (COALESCE), покривний індекс при цьому лишається в силі
+        for p_id, ts, in_stock, preorder in cursor.execute(f"SELECT product_id, timestamp, COALESCE(in_stock_qty, 0), COALESCE(preorder_qty, 0) FROM stock_history {history_filter}ORDER BY product_id, timestamp ASC", history_params):
+            if p_id != last_id:
+                last_id = p_id
+                xs, in_stocks, preorders = [], [], []
+                stock_by_product[p_id] = {"x": xs, "in_stock": in_stocks, "preorder": preorders}
+            xs.append(ts.replace(' ', 'T'))
+            in_stocks.append(in_stock)
+            preorders.append(preorder)
+
+        # Один час "зараз" для хвостів усіх графіків
+        now_str = datetime.now().isoformat(timespec='seconds')
         results = {}
         for p in products:
             p_id = p['id']
-            p_key = p['product_key']
-            graph_id = hashlib.md5(p_key.encode()).hexdigest()[:8]
-            
-            # Get Price History
-            cursor.execute("SELECT timestamp, price FROM price_history WHERE product_id = ? ORDER BY timestamp ASC", (p_id,))
-            price_history = []
-            for row in cursor.fetchall():
-                # Chart.js time adapter expects ISO or valid JS dates
-                ts = row['timestamp'].replace(' ', 'T')
-                price_history.append({"x": ts, "y": row['price']})
-
-            # Get Stock History
-            cursor.execute("SELECT timestamp, in_stock_qty, preorder_qty FROM stock_history WHERE product_id = ? ORDER BY timestamp ASC", (p_id,))
-            stock_history = []
-            for row in cursor.fetchall():
-                ts = row['timestamp'].replace(' ', 'T')
-                stock_history.append({
-                    "x": ts, 
-                    "in_stock": row['in_stock_qty'] or 0, 
-                    "preorder": row['preorder_qty'] or 0
-                })
+            graph_id = p['graph_id']
+            price_history = price_by_product.get(p_id) or {"x": [], "y": []}
+            stock_history = stock_by_product.get(p_id) or {"x": [], "in_stock": [], "preorder": []}
                 
             # Extend final points to NOW to draw the graph until current time
-            if price_history:
-                now_str = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                price_history.append({"x": now_str, "y": price_history[-1]['y']})
-            if stock_history:
-                now_str = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                last_stock = stock_history[-1].copy()
-                last_stock['x'] = now_str
-                stock_history.append(last_stock)
+            if price_history["x"]:
+                price_history["x"].append(now_str)
+                price_history["y"].append(price_history["y"][-1])
+            if stock_history["x"]:
+                stock_history["x"].append(now_str)
+                stock_history["in_stock"].append(stock_history["in_stock"][-1])
+                stock_history["preorder"].append(stock_history["preorder"][-1])
 
             results[p_id] = {
                 "id": p_id,
@@ -380,47 +497,101 @@ alt="Web Analytics" referrerPolicy="no-referrer-when-downgrade"></a></div></nosc
                 "stock_history": stock_history
             }
 
-        conn.close()
         return results
 
-    def generate_htmls(self, product_ids=None):
-        """Генерує локальні HTML файли. Якщо product_ids задано, бере тільки їх."""
+    def _changed_product_ids(self, product_ids=None) -> dict:
+        """
+        Товари, графік яких треба перегенерувати: з'явились нові записи історії
+        з моменту останнього вивантаження, або графік сьогодні ще не оновлювався
+        (щоб хвіст графіка і дата "Оновлено" не застарівали більше ніж на добу).
+        Повертає {product_id: запис для graph_cache}.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        db = HistoryDB(self.db_path)
+        try:
+            signatures = db.get_history_signatures()
+            cache = db.get_graph_cache()
+        finally:
+            db.close()
+        wanted = set(product_ids) if product_ids else None
+        changed = {}
+        for p_id, signature in signatures.items():
+            if wanted is not None and p_id not in wanted:
+                continue
+            entry = signature + (today,)
+            if cache.get(p_id) != entry:
+                changed[p_id] = entry
+        return changed
+
+    def _render_pages(self, product_ids=None, only_changed=False):
+        """
+        Рендерить HTML графіків: генератор пар (ім'я файлу, html).
+        only_changed=True пропускає товари, графік яких не змінився з останнього вивантаження;
+        записи для graph_cache накопичуються в self._pending_cache.
+        """
+        self._pending_cache = {}
+        if only_changed:
+            changed = self._changed_product_ids(product_ids)
+            if not changed:
+                logger.info("Графіки не змінились з останнього вивантаження.")
+                return
+            product_ids = list(changed)
         data = self.extract_data(product_ids=product_ids)
-        generated_files = []
         now_str = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+        asset_sources = self._asset_sources()
 
         for p_id, p_data in data.items():
-            if not p_data['price_history'] and not p_data['stock_history']:
+            if not p_data['price_history']['x'] and not p_data['stock_history']['x']:
                 continue # Skip if completely empty
 
-            json_data = json.dumps({
+            json_data = _chart_json({
                 "price_history": p_data['price_history'],
                 "stock_history": p_data['stock_history']
             })
 
-            html_content = HTML_TEMPLATE.replace(
-                "{product_name}", p_data['name']
-            ).replace(
-                "{product_url}", p_data['url']
-            ).replace(
-                "{last_updated}", now_str
-            ).replace(
-                "{__DATA__}", json_data
-            )
+            # Назва та URL потрапляють у текст і атрибут href, тому екрануються
+            html_content = _render_template({
+                "product_name": escape(p_data['name']),
+                "product_url": escape(p_data['url']),
+                "last_updated": now_str,
+                "__DATA__": json_data,
+                **asset_sources
+            })
 
             # --- Ін'єкція аналітики ---
             # Виконується динамічно, щоб не залежати від жорсткого HTML_TEMPLATE
             html_content = self._inject_statcounter(html_content)
 
-            graph_id = p_data['graph_id']
-            file_path = os.path.join(self.output_dir, f"graph_{graph_id}.html")
+            if only_changed:
+                self._pending_cache[p_id] = changed[p_id]
+            yield f"graph_{p_data['graph_id']}.html", html_content
+
+    def generate_htmls(self, product_ids=None, only_changed=False):
+        """Генерує локальні HTML файли. Якщо product_ids задано, бере тільки їх.
+        only_changed=True пропускає товари, графік яких не змінився з останнього вивантаження."""
+        generated_files = []
+        for file_name, html_content in self._render_pages(product_ids, only_changed):
+            file_path = os.path.join(self.output_dir, file_name)
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(html_content)
-                
-            generated_files.append((file_path, f"graph_{graph_id}.html"))
-            
+            generated_files.append((file_path, file_name))
         return generated_files
 
+    def _page_bodies(self, product_ids=None, only_changed=False):
+        """Генератор пар (вміст сторінки в bytes, ім'я на сервері)"""
+        for file_name, html_content in self._render_pages(product_ids, only_changed):
+            body = html_content.encode('utf-8')
+            if self.gzip_pages:
+                # Веб-сервер віддає graph_<id>.html.gz на запит graph_<id>.html (Content-Encoding: gzip)
+                body, file_name = gzip.compress(body, compresslevel=6, mtime=0), file_name + '.gz'
+            yield body, file_name
+
+    def generate_and_upload(self, product_ids=None, only_changed=False) -> int:
+        """Генерує графіки в пам'яті та вивантажує їх на SFTP без тимчасових файлів.
+        Генерація наступних сторінок іде паралельно з вивантаженням готових.
+        Повертає кількість вивантажених графіків."""
+        return self._upload(self._page_bodies(product_ids, only_changed))
+
     def capture_screenshots(self, driver, files):
         """
         Captures screenshots of generated HTML files using the provided Selenium driver.
@@ -462,11 +633,73 @@ alt="Web Analytics" referrerPolicy="no-referrer-when-downgrade"></a></div></nosc
             
         return png_files
 
-    def upload_to_sftp(self, files):
-        """Завантажує згенеровані файли на SFTP сервер"""
-        if not files:
-            logger.info("Немає файлів для вивантаження.")
+    def _save_graph_cache(self):
+        """Запам'ятовує вивантажені графіки, щоб не генерувати їх повторно без змін"""
+        if not self._pending_cache:
             return
+        try:
+            db = HistoryDB(self.db_path)
+            try:
+                db.update_graph_cache(self._pending_cache)
+            finally:
+                db.close()
+            self._pending_cache = {}
+        except Exception as e:
+            logger.warning(f"Не вдалося зберегти кеш графіків: {e}")
+
+    def _put_files(self, client, sftp, remote_dir, files):
+        """Вивантажує файли з черги (до маркера None) через наданий SFTP-канал
+        або власний, що відкривається з першим файлом.
+        Джерело — шлях до локального файлу або готовий вміст (bytes).
+        Після помилки черга дочитується без вивантаження, щоб генерація не зависла на put()."""
+        error = None
+        try:
+            while True:
+                item = files.get()
+                if item is None:
+                    break
+                if error:
+                    continue
+                source, remote_name = item
+                try:
+                    if sftp is None:
+                        sftp = client.open_sftp()
+                        if remote_dir:
+                            sftp.chdir(remote_dir)
+                        sftp.get_channel().settimeout(SFTP_TIMEOUT)
+                    logger.info(f"Uploading {remote_name}...")
+                    if isinstance(source, bytes):
+                        sftp.putfo(io.BytesIO(source), remote_name, file_size=len(source))
+                    else:
+                        sftp.put(source, remote_name)
+                except Exception as e:
+                    error = e
+        finally:
+            if sftp is not None:
+                sftp.close()
+        if error:
+            raise error
+
+    def _upload_assets(self, sftp):
+        """Вивантажує локальні скрипти Chart.js, якщо на сервері їх немає або розмір відрізняється"""
+        for path, file_name in self._asset_files or ():
+            try:
+                if sftp.stat(file_name).st_size == os.path.getsize(path):
+                    continue
+            except IOError:
+                pass # Файлу ще немає на сервері
+            logger.info(f"Uploading {file_name}...")
+            sftp.put(path, file_name)
+
+    def _upload(self, files) -> int:
+        """Вивантажує пари (джерело, ім'я на сервері) на SFTP; files може бути генератором,
+        тоді наступні пари готуються, поки вивантажуються попередні.
+        Повертає кількість вивантажених файлів (0 у разі помилки)."""
+        files = iter(files)
+        first = next(files, None)
+        if first is None:
+            logger.info("Немає файлів для вивантаження.")
+            return 0
 
         logger.info(f"Підключення до SFTP {self.ftp_host}...")
         try:
@@ -475,33 +708,57 @@ alt="Web Analytics" referrerPolicy="no-referrer-when-downgrade"></a></div></nosc
             client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             client.connect(hostname=self.ftp_host, username=self.ftp_user, password=self.ftp_pass, timeout=15)
             
-            sftp = client.open_sftp()
-            
-            if self.ftp_dir and self.ftp_dir != '/':
-                try:
-                    sftp.chdir(self.ftp_dir)
-                except Exception as e:
-                    logger.warning(f"Could not change to FTP_DIR {self.ftp_dir}: {e}")
-            
-            for local_path, remote_name in files:
-                logger.info(f"Uploading {remote_name}...")
-                sftp.put(local_path, remote_name)
-                
-            sftp.close()
-            client.close()
-            logger.info(f"✅ Успішно завантажено {len(files)} графіків на сервер!")
-            
-            # Очищення локальних тимчасових файлів після успішного завантаження
-            for local_path, _ in files:
-                try:
-                    if local_path.endswith('.html'):
-                        os.remove(local_path)
-                except Exception as e:
-                    logger.warning(f"Не вдалося видалити тимчасовий файл {local_path}: {e}")
-            logger.info("🧹 Локальні тимчасові файли очищено.")
+            try:
+                sftp = client.open_sftp()
+                if self.ftp_dir and self.ftp_dir != '/':
+                    try:
+                        sftp.chdir(self.ftp_dir)
+                    except Exception as e:
+                        logger.warning(f"Could not change to FTP_DIR {self.ftp_dir}: {e}")
+                remote_dir = sftp.getcwd() # None, якщо FTP_DIR не задано (домашня директорія)
+                self._upload_assets(sftp)
+
+                # Паралельне вивантаження: кожен потік має власний SFTP-канал на спільному SSH-з'єднанні
+                # і бере файли з обмеженої черги, яку поточний потік наповнює по мірі генерації
+                pending = queue.Queue(maxsize=SFTP_QUEUE_SIZE)
+                count = 0
+                with ThreadPoolExecutor(max_workers=SFTP_UPLOAD_WORKERS) as executor:
+                    futures = [
+                        executor.submit(self._put_files, client, sftp if i == 0 else None, remote_dir, pending)
+                        for i in range(SFTP_UPLOAD_WORKERS)
+                    ]
+                    try:
+                        for item in chain((first,), files):
+                            pending.put(item)
+                            count += 1
+                    finally:
+                        for _ in futures:
+                            pending.put(None)
+                    for future in futures:
+                        future.result()
+            finally:
+                client.close()
+            logger.info(f"✅ Успішно завантажено {count} графіків на сервер!")
+            self._save_graph_cache()
+            return count
 
         except Exception as e:
             logger.error(f"❌ Помилка SFTP: {e}")
+            return 0
+
+    def upload_to_sftp(self, files):
+        """Завантажує згенеровані файли на SFTP сервер"""
+        if not self._upload(files):
+            return
+
+        # Очищення локальних тимчасових файлів після успішного завантаження
+        for local_path, _ in files:
+            try:
+                if local_path.endswith('.html'):
+                    os.remove(local_path)
+            except Exception as e:
+                logger.warning(f"Не вдалося видалити тимчасовий файл {local_path}: {e}")
+        logger.info("🧹 Локальні тимчасові файли очищено.")
 
 if __name__ == "__main__":
     import argparse
@@ -510,10 +767,14 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     visualizer = HistoryVisualizer()
-    files = visualizer.generate_htmls()
-    logger.info(f"Згенеровано {len(files)} HTML файлів.")
-    
-    if args.local_only:
-        logger.info("Режим --local-only: Файли залишені в директорії html_output/. Вивантаження на FTP пропущено.")
-    else:
-        visualizer.upload_to_sftp(files)
+    try:
+        if args.local_only:
+            files = visualizer.generate_htmls()
+            logger.info(f"Згенеровано {len(files)} HTML файлів.")
+            logger.info("Режим --local-only: Файли залишені в директорії html_output/. Вивантаження на FTP пропущено.")
+        else:
+            # Без проміжних файлів: HTML вивантажується прямо з пам'яті
+            uploaded = visualizer.generate_and_upload()
+            logger.info(f"Згенеровано та вивантажено {uploaded} HTML файлів.")
+    finally:
+        visualizer.close()